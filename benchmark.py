@@ -0,0 +1,386 @@
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import json
+import math
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from urllib.parse import parse_qs, urlparse
+
+import portfoliodata
+
+def generate_ledger(filename, trade_count, currency_count, trade_mix, seed):
+  random_state = np.random.RandomState(seed)
+  currencies = ['COIN' + str(i) for i in range(currency_count)]
+  trade_types = random_state.choice(len(trade_mix), size=trade_count, p=np.array(trade_mix) / sum(trade_mix))
+  buy_currency_choices = random_state.randint(currency_count, size=trade_count)
+  sell_currency_choices = random_state.randint(currency_count, size=trade_count)
+  buy_amounts = random_state.uniform(0.1, 10, trade_count).round(8)
+  sell_fractions = random_state.uniform(0.05, 0.5, trade_count)
+  values = random_state.uniform(1, 1000, trade_count).round(8)
+  gifts = random_state.uniform(size=trade_count) < 0.1
+  minutes = np.cumsum(random_state.randint(0, 4, size=trade_count))
+  trade_dates = (pd.Timestamp(ledger_start_date) + pd.to_timedelta(minutes, unit='m')).strftime(portfoliodata.trade_date_format)
+
+  balances = [0.0] * currency_count
+  rows = []
+
+  for i in range(trade_count):
+    trade_type = trade_types[i]
+    buy_currency = buy_currency_choices[i]
+    sell_currency = sell_currency_choices[i]
+    value = values[i]
+    exchange = 'Exchange' + str(i % 5)
+
+    if trade_type == 2 and balances[sell_currency] > 0:
+      sell_amount = round(balances[sell_currency] * sell_fractions[i], 8)
+      balances[sell_currency] = round(balances[sell_currency] - sell_amount, 8)
+      rows.append(['Spend', '-', '', '0', sell_amount, currencies[sell_currency], value, '-', '', exchange, '', 'Gift' if gifts[i] else '', trade_dates[i]])
+      continue
+
+    balances[buy_currency] = round(balances[buy_currency] + buy_amounts[i], 8)
+
+    if trade_type == 1 and sell_currency != buy_currency and balances[sell_currency] > 0:
+      sell_amount = round(balances[sell_currency] * sell_fractions[i], 8)
+      balances[sell_currency] = round(balances[sell_currency] - sell_amount, 8)
+      rows.append(['Trade', buy_amounts[i], currencies[buy_currency], value, sell_amount, currencies[sell_currency], round(value * 0.99, 8), '-', '', exchange, '', '', trade_dates[i]])
+    elif trade_type == 1:
+      rows.append(['Trade', buy_amounts[i], currencies[buy_currency], value, value, 'USD', round(value * 0.99, 8), '-', '', exchange, '', '', trade_dates[i]])
+    else:
+      rows.append(['Income', buy_amounts[i], currencies[buy_currency], value, '-', '', '0', '-', '', exchange, '', '', trade_dates[i]])
+
+  ledger_df = pd.DataFrame(rows, columns=ledger_columns)
+  ledger_df.to_csv(filename, index=False, quoting=1, encoding='utf-8')
+
+  return currencies
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  currencies = []
+  latency = 0
+
+  def do_GET(self):
+    time.sleep(self.latency)
+    url = urlparse(self.path)
+    query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+
+    if url.path.endswith('/histohour'):
+      body = get_stub_histohour(query['fsym'], query['tsym'], int(query['limit']), int(query['toTs']))
+    elif url.path.endswith('/all/coinlist'):
+      body = {'Response': 'Success', 'Data': dict((currency, {}) for currency in self.currencies + stub_cryptocurrencies + portfoliodata.fiat_currencies)}
+    elif url.path.endswith('/listings/'):
+      body = {'data': [{'symbol': currency, 'id': i + 1} for i, currency in enumerate(stub_cryptocurrencies + self.currencies)]}
+    elif url.path.endswith('/ticker/'):
+      start = int(query['start'])
+      coin_ids = range(start, min(start + int(query['limit']), len(stub_cryptocurrencies + self.currencies) + 1))
+      body = {'data': [{'id': coin_id, 'quotes': get_stub_quotes(coin_id, ['USD', query['convert']])} for coin_id in coin_ids]}
+    elif '/ticker/' in url.path:
+      body = {'data': {'quotes': get_stub_quotes(int(url.path.split('/')[-2]), [query['convert']])}}
+    else:
+      self.send_error(404)
+      return
+
+    response = json.dumps(body).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(response)))
+    self.end_headers()
+    self.wfile.write(response)
+
+  def log_message(self, format, *args):
+    pass
+
+class StubServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+def get_stub_histohour(from_currency, to_currency, limit, to_hour):
+  to_hour = to_hour // portfoliodata.seconds_per_hour * portfoliodata.seconds_per_hour
+  hours = range(to_hour - limit * portfoliodata.seconds_per_hour, to_hour + portfoliodata.seconds_per_hour, portfoliodata.seconds_per_hour)
+
+  return {'Response': 'Success', 'Data': [{'time': hour, 'close': get_stub_price(hour, to_currency)} for hour in hours]}
+
+def get_stub_quotes(coin_id, to_currencies):
+  return dict((to_currency, {'price': get_stub_price(coin_id, to_currency)}) for to_currency in to_currencies)
+
+def get_stub_price(seed, to_currency):
+  price = 1 + 0.1 * math.sin(seed / 7200.0)
+
+  if portfoliodata.get_is_currency_fiat(to_currency):
+    return round(price * 100, 8)
+  return round(price / 10000, 8)
+
+def start_stub_server(currencies, latency=0):
+  StubRequestHandler.currencies = currencies
+  StubRequestHandler.latency = latency
+  server = StubServer(('127.0.0.1', 0), StubRequestHandler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+
+  return server, 'http://127.0.0.1:' + str(server.server_address[1]) + '/'
+
+def use_stub_server(stub_url, working_directory):
+  os.chdir(working_directory)
+  portfoliodata.cryptocompare_api_base_url = stub_url + 'data/'
+  portfoliodata.coinmarketcap_api_base_url = stub_url + 'v2/'
+  portfoliodata.rate_limits = {}
+
+def run_benchmark(ledger_filename, valuation_cryptocurrencies, stub_url, working_directory, trace_memory):
+  use_stub_server(stub_url, working_directory)
+
+  cryptocompare_session = portfoliodata.create_cryptocompare_session()
+  coinmarketcap_session = portfoliodata.create_coinmarketcap_session()
+  price_store = portfoliodata.open_price_store(':memory:')
+  stages = OrderedDict()
+
+  input_df = time_stage(stages, 'read_input_file', trace_memory, portfoliodata.read_input_file, ledger_filename)
+
+  valuation_currencies = [portfoliodata.get_primary_valuation_currency(input_df.columns)] + portfoliodata.check_valuation_cryptocurrencies(valuation_cryptocurrencies, cryptocompare_session)
+  input_df['buy_is_currency_fiat'] = portfoliodata.get_are_currencies_fiat(input_df['buy_currency'])
+  input_df['sell_is_currency_fiat'] = portfoliodata.get_are_currencies_fiat(input_df['sell_currency'])
+
+  input_df = time_stage(stages, 'add_trade_valuations_to_input_df', trace_memory, portfoliodata.add_trade_valuations_to_input_df, input_df, valuation_currencies, cryptocompare_session, price_store)
+
+  buy_df = portfoliodata.create_buy_or_sell_df(input_df, 'buy', valuation_currencies)
+  sell_df = portfoliodata.create_buy_or_sell_df(input_df, 'sell', valuation_currencies)
+
+  buy_and_sell_match_df = time_stage(stages, 'create_buy_and_sell_match_df', trace_memory, create_buy_and_sell_match_df, buy_df, sell_df, valuation_currencies)
+
+  pipeline = portfoliodata.create_table_pipeline(ledger_filename, valuation_currencies, cryptocompare_session, coinmarketcap_session, price_store)
+  pipeline['tables']['buy_and_sell_match'] = buy_and_sell_match_df
+
+  tables = time_stage(stages, 'create_realized_tables', trace_memory, portfoliodata.get_portfolio_tables, pipeline, portfoliodata.realized_table_names)
+  tables.update(time_stage(stages, 'create_unrealized_tables', trace_memory, portfoliodata.get_portfolio_tables, pipeline, portfoliodata.live_tables))
+
+  time_stage(stages, 'write_output_files', trace_memory, portfoliodata.write_output_files, ledger_filename, portfoliodata.round_portfolio_tables(tables), ['xlsx'], os.path.join(working_directory, 'benchmark.xlsx'))
+
+  return OrderedDict([('rows', len(input_df.index)), ('matches', len(buy_and_sell_match_df.index)), ('peak_rss_mb', portfoliodata.get_peak_rss_mb()), ('stages', stages)])
+
+def run_fetch_benchmark(valuation_cryptocurrencies, request_count, stub_url, working_directory):
+  use_stub_server(stub_url, working_directory)
+
+  missing_hours = create_histohour_batch(valuation_cryptocurrencies, request_count)
+  request_count = sum(len(portfoliodata.get_hour_ranges(hours, portfoliodata.cryptocompare_histohour_limit)) for hours in missing_hours.values())
+  results = OrderedDict()
+
+  for fetch_mode, request_limit in [('serial', 1), ('concurrent', portfoliodata.concurrent_request_limit)]:
+    portfoliodata.concurrent_request_limit = request_limit
+    cryptocompare_session = portfoliodata.create_cryptocompare_session()
+
+    start_time = time.perf_counter()
+    portfoliodata.fetch_cryptocompare_hourly_close_prices(missing_hours, cryptocompare_session)
+    seconds = time.perf_counter() - start_time
+
+    results[fetch_mode] = OrderedDict([('connections', request_limit), ('requests', request_count), ('seconds', seconds), ('requests_per_second', request_count / seconds)])
+
+  return results
+
+def create_histohour_batch(valuation_cryptocurrencies, request_count):
+  # Each request is a full range of hours, as in a first run over a long trade history
+  pairs = [('USD', currency) for currency in valuation_cryptocurrencies]
+  range_hours = (portfoliodata.cryptocompare_histohour_limit + 1) * portfoliodata.seconds_per_hour
+  from_hour = int(pd.Timestamp(ledger_start_date).timestamp())
+  missing_hours = OrderedDict()
+
+  for i, pair in enumerate(pairs):
+    range_count = request_count // len(pairs) + (1 if i < request_count % len(pairs) else 0)
+    missing_hours[pair] = np.arange(from_hour, from_hour + range_count * range_hours, portfoliodata.seconds_per_hour)
+
+  return missing_hours
+
+def create_buy_and_sell_match_df(buy_df, sell_df, valuation_currencies):
+  portfoliodata.check_for_valid_buy_and_sell_quantities(buy_df, sell_df)
+  buy_and_sell_match_df, remaining_buy_df = portfoliodata.match_buys_and_sells_by_currency(buy_df, sell_df, valuation_currencies, portfoliodata.matching_workers)
+
+  return portfoliodata.combine_matches_and_remaining_buys(buy_and_sell_match_df, remaining_buy_df)
+
+def time_stage(stages, stage_name, trace_memory, function, *args):
+  if trace_memory:
+    tracemalloc.start()
+
+  start_time = time.perf_counter()
+  start_cpu_time = time.process_time()
+  result = function(*args)
+  stage = OrderedDict([('seconds', time.perf_counter() - start_time), ('cpu_seconds', time.process_time() - start_cpu_time)])
+
+  if trace_memory:
+    stage['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1024.0 / 1024.0
+    tracemalloc.stop()
+
+  stages[stage_name] = stage
+
+  return result
+
+def find_regressions(results, baseline, tolerance):
+  regressions = []
+
+  for size, result in results.items():
+    if size not in baseline:
+      continue
+
+    for stage_name, stage in result['stages'].items():
+      baseline_seconds = baseline[size]['stages'].get(stage_name, {}).get('seconds')
+
+      if baseline_seconds is not None and stage['seconds'] > baseline_seconds * (1 + tolerance) and stage['seconds'] - baseline_seconds > regression_min_seconds:
+        regressions.append(size + ' rows ' + stage_name + ': ' + format_seconds(stage['seconds']) + ' vs ' + format_seconds(baseline_seconds) + ' baseline')
+
+    baseline_peak_rss_mb = baseline[size].get('peak_rss_mb')
+
+    if baseline_peak_rss_mb and result['peak_rss_mb'] and result['peak_rss_mb'] > baseline_peak_rss_mb * (1 + tolerance):
+      regressions.append(size + ' rows peak memory: ' + str(round(result['peak_rss_mb'])) + ' MB vs ' + str(round(baseline_peak_rss_mb)) + ' MB baseline')
+
+  return regressions
+
+def format_seconds(seconds):
+  return '%.3fs' % seconds
+
+def print_results(results, baseline):
+  for size, result in results.items():
+    print('\n' + size + ' rows (' + str(result['matches']) + ' matches, peak memory ' + str(round(result['peak_rss_mb'] or 0)) + ' MB)')
+
+    for stage_name, stage in result['stages'].items():
+      line = '  ' + stage_name.ljust(36) + format_seconds(stage['seconds']).rjust(10) + (' cpu ' + format_seconds(stage['cpu_seconds'])).rjust(16)
+
+      if 'peak_traced_mb' in stage:
+        line += (' traced ' + str(round(stage['peak_traced_mb'])) + ' MB').rjust(18)
+
+      baseline_seconds = baseline.get(size, {}).get('stages', {}).get(stage_name, {}).get('seconds')
+
+      if baseline_seconds:
+        line += ('%+.0f%%' % ((stage['seconds'] / baseline_seconds - 1) * 100)).rjust(10) + ' vs baseline'
+
+      print(line)
+
+def print_fetch_results(results, latency):
+  print('\n' + str(results['serial']['requests']) + ' CryptoCompare histohour requests with ' + format_seconds(latency) + ' stub latency')
+
+  for fetch_mode, result in results.items():
+    print('  ' + (fetch_mode + ', ' + str(result['connections']) + ' connection' + ('s' if result['connections'] != 1 else '')).ljust(36) + format_seconds(result['seconds']).rjust(10) + ('%.1f requests/s' % result['requests_per_second']).rjust(20))
+
+  print('  ' + 'speedup'.ljust(36) + ('%.1fx' % (results['serial']['seconds'] / results['concurrent']['seconds'])).rjust(10))
+
+def read_baseline(baseline_filename):
+  if not os.path.exists(baseline_filename):
+    return {}
+
+  with open(baseline_filename) as baseline_file:
+    return json.load(baseline_file)
+
+def write_results(results_filename, results):
+  with open(results_filename, 'w') as results_file:
+    json.dump(results, results_file, indent=2)
+
+def parse_arguments(arguments=None):
+  parser = argparse.ArgumentParser(description='Time each stage of portfoliodata.py on synthetic CoinTracking.info ledgers, using a local stub of the CryptoCompare and CoinMarketCap APIs.')
+  parser.add_argument('-s', '--sizes', default=','.join(str(size) for size in benchmark_sizes), help='comma-separated ledger sizes in rows (default: "%(default)s")')
+  parser.add_argument('--currencies', type=int, default=benchmark_currency_count, help='number of cryptocurrencies in each ledger (default: %(default)s)')
+  parser.add_argument('--mix', default=','.join(str(weight) for weight in benchmark_trade_mix), help='relative weights of income, trades and spends (default: "%(default)s")')
+  parser.add_argument('-c', '--valuation-currencies', default=','.join(portfoliodata.default_valuation_cryptocurrencies), help='comma-separated valuation cryptocurrencies (default: "%(default)s")')
+  parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic ledgers (default: %(default)s)')
+  parser.add_argument('--trace-memory', action='store_true', help='also report the peak memory traced by tracemalloc for each stage; stages run slower, so timings are not compared against the baseline')
+  parser.add_argument('--baseline', default=benchmark_baseline_filename, help='baseline results file to compare against (default: "%(default)s")')
+  parser.add_argument('--save-baseline', action='store_true', help='write the results to the baseline file instead of comparing against it')
+  parser.add_argument('--tolerance', type=float, default=regression_tolerance, help='allowed slowdown against the baseline before a stage is flagged (default: %(default)s)')
+  parser.add_argument('--fetch', action='store_true', help='instead of the stages, time the same batch of CryptoCompare histohour requests fetched serially and with concurrent connections; provider rate limits are not applied, so the difference is the network wait that concurrent fetching overlaps')
+  parser.add_argument('--fetch-requests', type=int, default=fetch_request_count, help='number of histohour requests for --fetch (default: %(default)s)')
+  parser.add_argument('--latency', type=float, default=stub_latency, help='seconds the stub waits before each response for --fetch (default: %(default)s)')
+  parser.add_argument('-o', '--output', help='also write the results to this JSON file')
+
+  return parser.parse_args(arguments)
+
+def main(arguments=None):
+  arguments = parse_arguments(arguments)
+
+  if arguments.trace_memory and arguments.save_baseline:
+    raise SystemExit('--trace-memory slows down the stages, so its timings cannot be saved as a baseline.')
+
+  if arguments.fetch and arguments.save_baseline:
+    raise SystemExit('--fetch does not time the stages, so its timings cannot be saved as a baseline.')
+
+  if arguments.fetch:
+    run_fetch_main(arguments)
+    return
+
+  sizes = [int(size) for size in arguments.sizes.split(',')]
+  trade_mix = [float(weight) for weight in arguments.mix.split(',')]
+  valuation_cryptocurrencies = portfoliodata.parse_valuation_cryptocurrencies(arguments.valuation_currencies)
+  working_directory = tempfile.mkdtemp(prefix='portfoliodata_benchmark_')
+  results = OrderedDict()
+
+  try:
+    for size in sizes:
+      ledger_filename = os.path.join(working_directory, 'ledger_' + str(size) + '.csv')
+      currencies = generate_ledger(ledger_filename, size, arguments.currencies, trade_mix, arguments.seed)
+      server, stub_url = start_stub_server(currencies)
+
+      try:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+          results[str(size)] = executor.submit(run_benchmark, ledger_filename, valuation_cryptocurrencies, stub_url, working_directory, arguments.trace_memory).result()
+      finally:
+        server.shutdown()
+        server.server_close()
+  finally:
+    shutil.rmtree(working_directory, ignore_errors=True)
+
+  if arguments.output:
+    write_results(arguments.output, results)
+
+  if arguments.save_baseline:
+    write_results(arguments.baseline, results)
+    print_results(results, {})
+    print('\n' + 'Saved baseline to ' + arguments.baseline)
+    return
+
+  if arguments.trace_memory:
+    print_results(results, {})
+    return
+
+  baseline = read_baseline(arguments.baseline)
+  print_results(results, baseline)
+  regressions = find_regressions(results, baseline, arguments.tolerance)
+
+  if regressions:
+    print('\n' + 'Regressions against ' + arguments.baseline + ':')
+    for regression in regressions:
+      print('  ' + regression)
+    raise SystemExit(1)
+
+def run_fetch_main(arguments):
+  valuation_cryptocurrencies = portfoliodata.parse_valuation_cryptocurrencies(arguments.valuation_currencies)
+  working_directory = tempfile.mkdtemp(prefix='portfoliodata_benchmark_')
+  server, stub_url = start_stub_server([], arguments.latency)
+
+  try:
+    with ProcessPoolExecutor(max_workers=1) as executor:
+      results = executor.submit(run_fetch_benchmark, valuation_cryptocurrencies, arguments.fetch_requests, stub_url, working_directory).result()
+  finally:
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(working_directory, ignore_errors=True)
+
+  if arguments.output:
+    write_results(arguments.output, results)
+
+  print_fetch_results(results, arguments.latency)
+
+ledger_columns = ['Type', 'Buy', 'Cur.', 'Buy value in USD', 'Sell', 'Cur.', 'Sell value in USD', 'Fee', 'Cur.', 'Exchange', 'Group', 'Comment', 'Trade Date']
+ledger_start_date = '2016-01-01'
+stub_cryptocurrencies = ['BTC', 'ETH']
+
+benchmark_sizes = [10000, 100000, 1000000]
+benchmark_currency_count = 50
+benchmark_trade_mix = [0.2, 0.6, 0.2]
+benchmark_baseline_filename = 'benchmark_baseline.json'
+regression_tolerance = 0.25
+regression_min_seconds = 0.05
+fetch_request_count = 100
+stub_latency = 0.05
+
+if __name__ == '__main__':
+  main()
@@ -1,53 +1,106 @@
-from datetime import timezone
+import argparse
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+import cProfile
+from functools import lru_cache
+import glob
+import hashlib
+import json
+import math
 import numpy as np
 import os
 import pandas as pd
-import pandas.io.formats.excel
+from pandas.api.types import union_categoricals
 import requests
 from requests.adapters import HTTPAdapter
 import requests_cache
 from requests.packages.urllib3.util.retry import Retry
-from statistics import mean
+import sqlite3
+import sys
+import threading
 import time
 import xlsxwriter
 
+try:
+  import resource
+except ImportError:
+  resource = None
+
+class PortfolioDataError(Exception):
+  pass
+
+class InputFileError(PortfolioDataError):
+  pass
+
+class PriceDataError(PortfolioDataError):
+  pass
+
+class TradeDataError(PortfolioDataError):
+  pass
+
+class OutputFileError(PortfolioDataError):
+  pass
+
 def retry_session(url, error_codes, expire_after=None):
   session = requests_cache.CachedSession(allowable_codes=(200,), expire_after=expire_after)
-  retry = Retry(
-      total=12,
-      backoff_factor=0.1,
-      method_whitelist=('GET', 'POST'),
-      status_forcelist=error_codes
-  )
-  adapter = HTTPAdapter(max_retries=retry)
+  try:
+    retry = Retry(
+        total=12,
+        backoff_factor=0.1,
+        allowed_methods=('GET', 'POST'),
+        status_forcelist=error_codes
+    )
+  except TypeError:
+    retry = Retry(
+        total=12,
+        backoff_factor=0.1,
+        method_whitelist=('GET', 'POST'),
+        status_forcelist=error_codes
+    )
+  adapter = HTTPAdapter(max_retries=retry, pool_maxsize=concurrent_request_limit)
   session.mount(url, adapter)
   return session
 
+def create_cryptocompare_session():
+  return retry_session(cryptocompare_api_base_url, error_codes, expire_after=None)
+
+def create_coinmarketcap_session():
+  return retry_session(coinmarketcap_api_base_url, error_codes, expire_after=120)
+
 def get_valuation_cryptocurrencies(cryptocompare_session):
+  if not sys.stdin.isatty():
+    return list(default_valuation_cryptocurrencies)
+
+  while True:
+    user_input = input('Input the valuation cryptocurrencies you want to use, separated by commas (or leave blank to use the default of ' + ', '.join(default_valuation_cryptocurrencies) + '), and press enter: ')
+
+    try:
+      return check_valuation_cryptocurrencies(parse_valuation_cryptocurrencies(user_input), cryptocompare_session)
+    except PriceDataError as error:
+      print('\n' + str(error) + '\n')
+
+def parse_valuation_cryptocurrencies(user_input):
+  if user_input.strip() == '':
+    return list(default_valuation_cryptocurrencies)
+
+  return user_input.split(',')
+
+def check_valuation_cryptocurrencies(valuation_cryptocurrencies, cryptocompare_session):
   cryptocompare_currencies = get_cryptocompare_currencies(cryptocompare_session)
-  user_input_valid = False
-  
-  while not user_input_valid:    
-    user_input = input('Input the valuation cryptocurrencies you want to use, separated by commas (or leave blank to use the default of BTC, ETH), and press enter: ')
-    
-    if user_input.strip() == '':
-      valuation_cryptocurrencies = ['BTC', 'ETH']
-      user_input_valid = True
-    else:
-      valuation_cryptocurrencies = []
-      user_input_currencies = [currency.upper().strip() for currency in user_input.split(',')]
-      for currency in user_input_currencies:
-        if not currency in valuation_cryptocurrencies:
-          valuation_cryptocurrencies.append(currency)
-      unsupported_currencies = list(set(valuation_cryptocurrencies).difference(cryptocompare_currencies))
-
-      if unsupported_currencies:
-        print('\n' + 'The following currencies are not supported by the CryptoCompare API: ' + ','.join(unsupported_currencies) + '.  Please try again with a different list of currencies.'+ '\n')
-      else:
-        user_input_valid = True
-      
-  return valuation_cryptocurrencies
+  checked_valuation_cryptocurrencies = []
+
+  for currency in [currency.upper().strip() for currency in valuation_cryptocurrencies]:
+    if not currency in checked_valuation_cryptocurrencies:
+      checked_valuation_cryptocurrencies.append(currency)
+  unsupported_currencies = list(set(checked_valuation_cryptocurrencies).difference(cryptocompare_currencies))
+
+  if unsupported_currencies:
+    raise PriceDataError('The following currencies are not supported by the CryptoCompare API: ' + ','.join(unsupported_currencies) + '.  Please try again with a different list of currencies.')
 
+  return checked_valuation_cryptocurrencies
+
+@lru_cache(maxsize=None)
 def get_cryptocompare_currencies(cryptocompare_session):
   error_message = '\n' + 'The program encountered an error while trying to retrieve historical prices from the CryptoCompare API.  Please try running the program again later.'
   try:
@@ -55,24 +108,68 @@ def get_cryptocompare_currencies(cryptocompare_session):
     response_json = response.json()
     
     if response_json['Response'] == 'Success':
-      cryptocompare_currencies = [currency.upper().strip() for currency in response_json['Data']]
+      cryptocompare_currencies = frozenset(currency.upper().strip() for currency in response_json['Data'])
     else:
-      print_error_message_and_exit(error_message)
+      raise PriceDataError(error_message)
   except:
-    print_error_message_and_exit(error_message)
+    raise PriceDataError(error_message)
 
   return cryptocompare_currencies
 
 def read_input_file(input_filename):
+  columns = read_input_columns(input_filename)
+
+  check_for_required_columns(columns)
+
   try:
-    input_df = pd.read_csv(input_filename, na_filter=False)
+    input_chunks = pd.read_csv(input_filename, header=0, names=columns, usecols=get_required_columns(columns), dtype=str, na_filter=False, chunksize=input_chunk_size)
+    input_chunks = [format_values(input_chunk) for input_chunk in input_chunks]
+  except InputFileError:
+    raise
   except:
-    print_error_message_and_exit('The program encountered an error while trying to read the input file.  Please make sure there is a file named "' + input_filename + '" in the same directory as the program file named "' + os.path.basename(__file__) + '", and try running the program again.')
-  return input_df
+    raise InputFileError(get_input_file_error_message(input_filename))
 
-def print_error_message_and_exit(error_message):
-  print(error_message)
-  raise SystemExit
+  return concat_input_chunks(input_chunks)
+
+def read_input_columns(input_file_or_df):
+  if isinstance(input_file_or_df, pd.DataFrame):
+    return format_columns(input_file_or_df.columns)
+
+  try:
+    return format_columns(pd.read_csv(input_file_or_df, nrows=0).columns)
+  except:
+    raise InputFileError(get_input_file_error_message(input_file_or_df))
+
+def get_input_file_error_message(input_filename):
+  return 'The program encountered an error while trying to read the input file.  Please make sure there is a file named "' + input_filename + '" in the same directory as the program file named "' + os.path.basename(__file__) + '", and try running the program again.'
+
+def format_input_df(input_df):
+  input_df = input_df.copy()
+  input_df.columns = format_columns(input_df.columns)
+
+  check_for_required_columns(input_df.columns)
+
+  input_df = input_df[get_required_columns(input_df.columns)]
+  text_columns = input_df.select_dtypes(exclude=['number', 'datetime']).columns
+  input_df[text_columns] = input_df[text_columns].fillna('')
+
+  try:
+    return format_values(input_df)
+  except InputFileError:
+    raise
+  except:
+    raise InputFileError('The program encountered an error while trying to read the input trades.  Please make sure they are in the CoinTracking.info trade list format and try again.')
+
+def concat_input_chunks(input_chunks):
+  if len(input_chunks) == 1:
+    return input_chunks[0]
+
+  for column in categorical_input_columns:
+    categories = union_categoricals([input_chunk[column] for input_chunk in input_chunks]).categories
+    for input_chunk in input_chunks:
+      input_chunk[column] = input_chunk[column].cat.set_categories(categories)
+
+  return pd.concat(input_chunks, ignore_index=True)
 
 def format_columns(columns):
   new_columns = []
@@ -98,100 +195,346 @@ def get_primary_valuation_currency(columns):
         primary_valuation_currency = currency
 
   if not primary_valuation_currency:
-    print_error_message_and_exit('The input file does not have a buy value column in a supported fiat currency.  Please provide an input file with a buy value column in one of the following fiat currencies and run the program again: ' + ', '.join(fiat_currencies) + '.')
+    raise InputFileError('The input file does not have a buy value column in a supported fiat currency.  Please provide an input file with a buy value column in one of the following fiat currencies and run the program again: ' + ', '.join(fiat_currencies) + '.')
   return primary_valuation_currency
 
-def check_for_required_columns(columns):
+def get_required_columns(columns):
   primary_valuation_currency = get_primary_valuation_currency(columns).lower()
 
-  required_columns = ['type', 'buy', 'buy_currency', 'buy_value_' + primary_valuation_currency, 'sell', 'sell_currency', 'sell_value_' + primary_valuation_currency, 'exchange', 'comment', 'trade_date']
+  return ['type', 'buy', 'buy_currency', 'buy_value_' + primary_valuation_currency, 'sell', 'sell_currency', 'sell_value_' + primary_valuation_currency, 'exchange', 'comment', 'trade_date']
+
+def check_for_required_columns(columns):
+  required_columns = get_required_columns(columns)
 
   missing_columns = list(set(required_columns).difference(columns))
   
   if missing_columns:
-    print_error_message_and_exit('The input file is missing the following required column(s): ' + ', '.join(missing_columns) + '.  Please correct the input file and run the program again.')  
+    raise InputFileError('The input file is missing the following required column(s): ' + ', '.join(missing_columns) + '.  Please correct the input file and run the program again.')
 
 def format_values(input_df):
   primary_valuation_currency = get_primary_valuation_currency(input_df.columns).lower()
   
-  input_df['type'] = input_df['type'].astype(str)
-  input_df['buy'] = input_df['buy'].astype(str).replace('-', '0').astype(float)
-  input_df['buy_currency'] = input_df['buy_currency'].astype(str)
-  input_df['buy_value_' + primary_valuation_currency] = input_df['buy_value_' + primary_valuation_currency].astype(float)
-  input_df['sell'] = input_df['sell'].astype(str).replace('-', '0').astype(float)
-  input_df['sell_currency'] = input_df['sell_currency'].astype(str)
-  input_df['sell_value_' + primary_valuation_currency] = input_df['sell_value_' + primary_valuation_currency].astype(float)
-  input_df['exchange'] = input_df['exchange'].astype(str)
+  input_df['type'] = input_df['type'].astype(str).astype('category')
+  input_df['buy'] = convert_input_values(input_df['buy'].astype(str).replace('-', '0'), convert_to_floats)
+  input_df['buy_currency'] = input_df['buy_currency'].astype(str).astype('category')
+  input_df['buy_value_' + primary_valuation_currency] = convert_input_values(input_df['buy_value_' + primary_valuation_currency], convert_to_floats)
+  input_df['sell'] = convert_input_values(input_df['sell'].astype(str).replace('-', '0'), convert_to_floats)
+  input_df['sell_currency'] = input_df['sell_currency'].astype(str).astype('category')
+  input_df['sell_value_' + primary_valuation_currency] = convert_input_values(input_df['sell_value_' + primary_valuation_currency], convert_to_floats)
+  input_df['exchange'] = input_df['exchange'].astype(str).astype('category')
   input_df['comment'] = input_df['comment'].astype(str)
-  input_df['trade_date'] = pd.to_datetime(input_df['trade_date'], format='%d.%m.%Y %H:%M')
+  if not pd.api.types.is_datetime64_any_dtype(input_df['trade_date']):
+    input_df['trade_date'] = convert_input_values(input_df['trade_date'], convert_to_trade_dates)
   input_df = input_df.round(internal_decimal_places)
   input_df.fillna('', inplace=True)
   
   return input_df
 
-def add_trade_valuations_to_input_df(input_df, valuation_currencies, cryptocompare_session):
-  primary_valuation_currency = valuation_currencies[0].lower()
-  
-  for valuation_currency in valuation_currencies:
-    valuation_currency = valuation_currency.lower()    
+def convert_input_values(values, convert):
+  try:
+    return convert(values)
+  except (TypeError, ValueError):
+    for row, value in values.items():
+      try:
+        convert(pd.Series([value]))
+      except (TypeError, ValueError):
+        raise InputFileError('The input file has an invalid value "' + str(value) + '" in the ' + str(values.name) + ' column on row ' + str(row + 1 if isinstance(row, (int, np.integer)) else row) + '.  Please correct the input file and run the program again.')
+    raise
 
-    for side in ['buy', 'sell']:
-      primary_valuation_column = side + '_value_' + primary_valuation_currency
-        
-      if valuation_currency != primary_valuation_currency:
-        valuation_column = side + '_value_' + valuation_currency
-        input_df[valuation_column] = input_df.apply(lambda row : convert_historical_trade_valuation(row[primary_valuation_column], primary_valuation_currency, valuation_currency, row['trade_date'], cryptocompare_session), axis=1)
+def convert_to_floats(values):
+  return values.astype(float)
 
-    input_df['buy_value_' + valuation_currency] = input_df.apply(lambda row : set_trade_valuation(row, valuation_currency), axis=1)
-    
-    input_df['sell_value_' + valuation_currency] = input_df['buy_value_' + valuation_currency]
+def convert_to_trade_dates(values):
+  return pd.to_datetime(values, format=trade_date_format, cache=True)
+
+def add_trade_valuations_to_input_df(input_df, valuation_currencies, cryptocompare_session, price_store):
+  valuation_currencies = [valuation_currency.lower() for valuation_currency in valuation_currencies]
+  primary_valuation_currency = valuation_currencies[0]
+  conversion_positions = [i for i, valuation_currency in enumerate(valuation_currencies) if valuation_currency != primary_valuation_currency]
+
+  average_prices = np.ones((len(input_df.index), len(valuation_currencies)))
+  average_prices[:, conversion_positions] = get_cryptocompare_average_hourly_price_matrix(primary_valuation_currency, [valuation_currencies[i] for i in conversion_positions], input_df['trade_date'], cryptocompare_session, price_store)
+
+  primary_trade_values = select_trade_valuations(input_df, [primary_valuation_currency], input_df[['buy_value_' + primary_valuation_currency]].values, input_df[['sell_value_' + primary_valuation_currency]].values)
+  converted_trade_values = primary_trade_values * average_prices
+  trade_values = select_trade_valuations(input_df, valuation_currencies, converted_trade_values, converted_trade_values)
+
+  input_df[get_valuation_columns(['buy_value_', 'sell_value_'], valuation_currencies)] = np.repeat(trade_values, 2, axis=1)
   
   return input_df
 
-def convert_historical_trade_valuation(from_value, from_currency, to_currency, trade_date, cryptocompare):
-  return from_value * get_cryptocompare_average_hourly_price(from_currency, to_currency, trade_date, cryptocompare)
-  
-def get_cryptocompare_average_hourly_price(from_currency, to_currency, date, cryptocompare_session):
-  unix_time = str(int(date.replace(tzinfo=timezone.utc).timestamp()))
-  from_currency = from_currency.upper()
-  to_currency = to_currency.upper()
-  result = None
-  
-  try:
-    response = get_request(cryptocompare_session, cryptocompare_api_base_url + 'histohour?fsym=' + from_currency + '&tsym=' + to_currency + '&limit=1&toTs=' + unix_time)
-    response_json = response.json()
+def get_trade_hours(dates):
+  return dates.values.astype('datetime64[s]').astype(np.int64) // seconds_per_hour * seconds_per_hour
 
-    if response_json['Response'] == 'Success':
-      result = mean([price['close'] for price in response_json['Data']])
+def get_cryptocompare_average_hourly_price_matrix(from_currency, to_currencies, dates, cryptocompare_session, price_store):
+  trade_hours = get_trade_hours(dates)
+  unique_trade_hours, trade_hour_positions = np.unique(trade_hours, return_inverse=True)
+  close_prices = get_cryptocompare_hourly_close_price_matrix(from_currency, to_currencies, np.union1d(unique_trade_hours - seconds_per_hour, unique_trade_hours), cryptocompare_session, price_store)
+
+  average_prices = (close_prices.reindex(unique_trade_hours - seconds_per_hour).values + close_prices.reindex(unique_trade_hours).values) / 2
+
+  return average_prices[trade_hour_positions.ravel()]
+
+def get_cryptocompare_hourly_close_price_matrix(from_currency, to_currencies, hours, cryptocompare_session, price_store):
+  pairs = [(from_currency.upper(), to_currency.upper()) for to_currency in to_currencies]
+  close_prices = get_cryptocompare_hourly_close_rates(OrderedDict((pair, hours) for pair in pairs), cryptocompare_session, price_store)
+
+  return pd.DataFrame(OrderedDict((pair[1], close_prices[pair]) for pair in pairs), columns=[pair[1] for pair in pairs], dtype=float)
+
+def get_cryptocompare_hourly_close_rates(pair_hours, cryptocompare_session, price_store, exact_rates=False):
+  requested_pairs, rate_paths = get_cryptocompare_rate_paths(list(pair_hours), exact_rates)
+  requested_pair_hours = OrderedDict((pair, np.array([], dtype=np.int64)) for pair in requested_pairs)
+
+  for pair, hours in pair_hours.items():
+    for requested_pair, direction in rate_paths[pair]:
+      requested_pair_hours[requested_pair] = np.union1d(requested_pair_hours[requested_pair], np.asarray(hours, dtype=np.int64))
+
+  close_prices = get_cryptocompare_pair_close_prices(requested_pair_hours, cryptocompare_session, price_store)
+
+  return OrderedDict((pair, derive_cryptocompare_close_prices(close_prices, pair, rate_paths[pair], hours)) for pair, hours in pair_hours.items())
+
+def get_cryptocompare_rate_paths(pairs, exact_rates=False):
+  if exact_rates:
+    return list(pairs), dict((pair, [(pair, 1)]) for pair in pairs)
+
+  # Pairs of the most common from currency are requested first, so each additional from currency is linked by a single requested pair
+  from_currency_counts = dict((from_currency, sum(1 for pair in pairs if pair[0] == from_currency)) for from_currency, to_currency in pairs)
+  components = dict((currency, set([currency])) for pair in pairs for currency in pair)
+  rate_graph = dict((currency, []) for currency in components)
+  requested_pairs = []
+
+  for pair in sorted(pairs, key=lambda pair: -from_currency_counts[pair[0]]):
+    from_currency, to_currency = pair
+
+    if components[from_currency] is not components[to_currency]:
+      component = components[from_currency] | components[to_currency]
+      for currency in component:
+        components[currency] = component
+
+      rate_graph[from_currency].append((to_currency, pair, 1))
+      rate_graph[to_currency].append((from_currency, pair, -1))
+      requested_pairs.append(pair)
+
+  return requested_pairs, dict((pair, find_rate_path(rate_graph, pair[0], pair[1])) for pair in pairs)
+
+def find_rate_path(rate_graph, from_currency, to_currency):
+  paths = {from_currency: []}
+  currencies = deque([from_currency])
+
+  while to_currency not in paths:
+    currency = currencies.popleft()
+
+    for next_currency, pair, direction in rate_graph[currency]:
+      if next_currency not in paths:
+        paths[next_currency] = paths[currency] + [(pair, direction)]
+        currencies.append(next_currency)
+
+  return paths[to_currency]
+
+def derive_cryptocompare_close_prices(close_prices, pair, rate_path, hours):
+  if rate_path == [(pair, 1)]:
+    return close_prices[pair]
+
+  hours = np.asarray(hours, dtype=np.int64)
+  derived_close_prices = np.ones(len(hours))
+
+  for requested_pair, direction in rate_path:
+    requested_close_prices = close_prices[requested_pair].reindex(hours).values
+
+    if direction == 1:
+      derived_close_prices = derived_close_prices * requested_close_prices
     else:
-      print_error_message_and_exit('The program encountered an error while trying to convert ' + from_currency + ' to ' + to_currency + '.  It is likely that CryptoCompare does not have data for one of these currencies.  Please select a different currency conversion pair and try running the program again.')
+      derived_close_prices = derived_close_prices / requested_close_prices
+
+  return pd.Series(derived_close_prices, index=hours).dropna()
+
+def get_cryptocompare_pair_close_prices(pair_hours, cryptocompare_session, price_store):
+  close_prices = OrderedDict()
+  missing_hours = OrderedDict()
+
+  for pair, hours in pair_hours.items():
+    close_prices[pair] = read_price_store(price_store, pair[0], pair[1], hours)
+    missing_hours[pair] = [int(hour) for hour in hours if int(hour) not in close_prices[pair]]
+    record_instrumentation_counter('price_store_hits', len(hours) - len(missing_hours[pair]))
+    record_instrumentation_counter('price_store_misses', len(missing_hours[pair]))
+
+  missing_hours = OrderedDict((pair, hours) for pair, hours in missing_hours.items() if hours)
+
+  if missing_hours and cryptocompare_session is not None:
+    fetched_close_prices = fetch_cryptocompare_hourly_close_prices(missing_hours, cryptocompare_session)
+
+    for pair, pair_close_prices in fetched_close_prices.items():
+      write_price_store(price_store, pair[0], pair[1], pair_close_prices)
+      close_prices[pair].update(pair_close_prices)
+
+  return OrderedDict((pair, pd.Series(pair_close_prices, dtype=float)) for pair, pair_close_prices in close_prices.items())
+
+def fetch_cryptocompare_hourly_close_prices(missing_hours, cryptocompare_session):
+  close_prices = OrderedDict((pair, {}) for pair in missing_hours)
+  urls = []
+
+  for pair, hours in missing_hours.items():
+    for from_hour, to_hour in get_hour_ranges(hours, cryptocompare_histohour_limit):
+      limit = str(max(1, (to_hour - from_hour) // seconds_per_hour))
+      urls.append((pair, cryptocompare_api_base_url + 'histohour?fsym=' + pair[0] + '&tsym=' + pair[1] + '&limit=' + limit + '&toTs=' + str(to_hour)))
+
+  try:
+    with cryptocompare_session.cache_disabled():
+      responses = get_requests(cryptocompare_session, [url for pair, url in urls])
+
+    for (pair, url), response in zip(urls, responses):
+      response_json = response.json()
+
+      if response_json['Response'] == 'Success':
+        for price in response_json['Data']:
+          close_prices[pair][price['time']] = price['close']
+      else:
+        raise PriceDataError('The program encountered an error while trying to convert ' + pair[0] + ' to ' + pair[1] + '.  It is likely that CryptoCompare does not have data for one of these currencies.  Please select a different currency conversion pair and try running the program again.')
+  except PriceDataError:
+    raise
   except:
-    print_error_message_and_exit('The program encountered an error while trying to retrieve historical prices from the CryptoCompare API.  Please try running the program again later.')
-  return result
+    raise PriceDataError('The program encountered an error while trying to retrieve historical prices from the CryptoCompare API.  Please try running the program again later.')
+
+  return close_prices
+
+def get_hour_ranges(hours, limit):
+  hour_ranges = []
+
+  for hour in hours:
+    if hour_ranges and hour - hour_ranges[-1][0] <= limit * seconds_per_hour:
+      hour_ranges[-1][1] = int(hour)
+    else:
+      hour_ranges.append([int(hour), int(hour)])
+
+  return hour_ranges
+
+def open_price_store(price_store_filename):
+  price_store = sqlite3.connect(price_store_filename)
+  price_store.execute('CREATE TABLE IF NOT EXISTS hourly_close_prices (fsym TEXT NOT NULL, tsym TEXT NOT NULL, hour INTEGER NOT NULL, close REAL NOT NULL, fetched_at INTEGER NOT NULL, PRIMARY KEY (fsym, tsym, hour))')
+  return price_store
+
+def read_price_store(price_store, from_currency, to_currency, hours):
+  if len(hours) == 0:
+    return {}
+
+  rows = price_store.execute('SELECT hour, close FROM hourly_close_prices WHERE fsym = ? AND tsym = ? AND hour BETWEEN ? AND ?', (from_currency, to_currency, int(min(hours)), int(max(hours))))
+  return dict(rows)
+
+def write_price_store(price_store, from_currency, to_currency, close_prices):
+  fetched_at = int(time.time())
+  rows = [(from_currency, to_currency, hour, close, fetched_at) for hour, close in close_prices.items() if hour + seconds_per_hour <= fetched_at]
+
+  price_store.executemany('INSERT OR REPLACE INTO hourly_close_prices (fsym, tsym, hour, close, fetched_at) VALUES (?, ?, ?, ?, ?)', rows)
+  price_store.commit()
+
+def load_price_store(price_store, close_prices):
+  fetched_at = int(time.time())
+
+  for (from_currency, to_currency), pair_close_prices in close_prices.items():
+    rows = [(from_currency, to_currency, int(hour), float(close), fetched_at) for hour, close in pair_close_prices.items()]
+    price_store.executemany('INSERT OR REPLACE INTO hourly_close_prices (fsym, tsym, hour, close, fetched_at) VALUES (?, ?, ?, ?, ?)', rows)
+
+  price_store.commit()
+
+def warm_price_store(price_store, from_currency, to_currencies, from_date, to_date, cryptocompare_session):
+  from_hour, to_hour = get_trade_hours(pd.Series([pd.Timestamp(from_date), pd.Timestamp(to_date)]))
+  hours = np.arange(from_hour - seconds_per_hour, to_hour + seconds_per_hour, seconds_per_hour)
+  get_cryptocompare_hourly_close_price_matrix(from_currency, to_currencies, hours, cryptocompare_session, price_store)
+
+def warm_price_store_for_input_files(price_store, input_filenames, valuation_cryptocurrencies, from_date, to_date, cryptocompare_session):
+  valuation_cryptocurrencies = check_valuation_cryptocurrencies(valuation_cryptocurrencies, cryptocompare_session)
+  primary_valuation_currencies = []
+
+  for input_filename in input_filenames:
+    try:
+      primary_valuation_currency = get_primary_valuation_currency(read_input_columns(input_filename))
+    except InputFileError:
+      continue
+
+    if primary_valuation_currency not in primary_valuation_currencies:
+      primary_valuation_currencies.append(primary_valuation_currency)
+
+  for primary_valuation_currency in primary_valuation_currencies:
+    warm_price_store(price_store, primary_valuation_currency, [currency for currency in valuation_cryptocurrencies if currency != primary_valuation_currency], from_date, to_date, cryptocompare_session)
+
+def evict_price_store(price_store, max_age=None, max_rows=None):
+  if max_age is not None:
+    price_store.execute('DELETE FROM hourly_close_prices WHERE fetched_at < ?', (int(time.time()) - max_age,))
+
+  if max_rows is not None:
+    price_store.execute('DELETE FROM hourly_close_prices WHERE rowid IN (SELECT rowid FROM hourly_close_prices ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)', (max_rows,))
+
+  price_store.commit()
 
 def get_request(session, url):
   headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/67.0.3396.40 Safari/537.36'
     }
-  return session.get(url, headers=headers, timeout=5)
-  
-def set_trade_valuation(row, valuation_currency):
-  buy = row['buy']
-  sell = row['sell']
-  valuation_currency = valuation_currency.lower()
+
+  if isinstance(session, requests_cache.CachedSession):
+    response = session.get(url, headers=headers, timeout=5, only_if_cached=True)
+
+    if response.status_code != 504:
+      record_instrumentation_counter('cache_hits')
+      return response
+
+  wait_for_rate_limit(url)
+
+  start_time = time.perf_counter()
+  response = session.get(url, headers=headers, timeout=5)
+  record_http_request(response, time.perf_counter() - start_time)
+
+  return response
+
+def get_requests(session, urls):
+  with ThreadPoolExecutor(max_workers=concurrent_request_limit) as executor:
+    return list(executor.map(lambda url : get_request(session, url), urls))
+
+def create_rate_limit(requests_per_second, burst):
+  return {'requests_per_second': requests_per_second, 'burst': burst, 'tokens': burst, 'updated_at': time.monotonic(), 'lock': threading.Lock()}
+
+def get_rate_limit(url):
+  # The base URLs are read on every request, so the limits follow the configured providers
+  provider_base_urls = [('cryptocompare', cryptocompare_api_base_url), ('coinmarketcap', coinmarketcap_api_base_url)]
+
+  for provider, base_url in provider_base_urls:
+    if url.startswith(base_url):
+      return rate_limits.get(provider)
+
+  return None
+
+def wait_for_rate_limit(url):
+  rate_limit = get_rate_limit(url)
+
+  if rate_limit is None:
+    return
+
+  with rate_limit['lock']:
+    now = time.monotonic()
+    rate_limit['tokens'] = min(rate_limit['burst'], rate_limit['tokens'] + (now - rate_limit['updated_at']) * rate_limit['requests_per_second']) - 1
+    rate_limit['updated_at'] = now
+    wait = -rate_limit['tokens'] / rate_limit['requests_per_second']
+
+  if wait > 0:
+    time.sleep(wait)
   
-  if row['buy_currency'].lower() == valuation_currency:
-    result = buy
-  elif row['sell_currency'].lower() == valuation_currency:
-    result = sell
-  elif not sell or sell == 0:
-    result = row['buy_value_' + valuation_currency]
-  else:
-    result = row['sell_value_' + valuation_currency]
-  return result
+def select_trade_valuations(input_df, valuation_currencies, buy_values, sell_values):
+  valuation_currencies = np.array([valuation_currency.lower() for valuation_currency in valuation_currencies], dtype=object)
+
+  conditions = [
+    input_df['buy_currency'].str.lower().values.astype(object)[:, np.newaxis] == valuation_currencies,
+    input_df['sell_currency'].str.lower().values.astype(object)[:, np.newaxis] == valuation_currencies,
+    (input_df['sell'].values == 0)[:, np.newaxis]
+    ]
+  choices = [input_df['buy'].values[:, np.newaxis], input_df['sell'].values[:, np.newaxis], buy_values]
+
+  return np.select(conditions, choices, default=sell_values)
 
 def get_is_currency_fiat(currency):
-  return currency.upper() in fiat_currencies
+  return currency.upper() in fiat_currency_set
+
+def get_are_currencies_fiat(currencies):
+  return currencies.str.upper().isin(fiat_currency_set)
   
 def create_buy_or_sell_df(input_df, side, valuation_currencies):
   valuation_columns = get_valuation_columns([side + '_value_'], valuation_currencies)
@@ -207,261 +550,1070 @@ def get_valuation_columns(prefixes, valuation_currencies):
   return valuation_columns
   
 def check_for_valid_buy_and_sell_quantities(buy_df, sell_df):
-  for currency in sell_df['sell_currency'].unique():
-    if sell_df.loc[sell_df['sell_currency'] == currency, 'sell'].sum().round(internal_decimal_places) > buy_df.loc[buy_df['buy_currency'] == currency, 'buy'].sum().round(internal_decimal_places):
-      print_error_message_and_exit('The units sold of ' + currency + ' exceed the units acquired.  Please correct the input file and try again.')
+  sell_quantities = sell_df['sell'].groupby(sell_df['sell_currency'].values.astype(object), sort=False).sum().round(internal_decimal_places)
+  buy_quantities = buy_df['buy'].groupby(buy_df['buy_currency'].values.astype(object)).sum().round(internal_decimal_places).reindex(sell_quantities.index, fill_value=0)
+  oversold_currencies = sell_quantities.index[(sell_quantities > buy_quantities).values]
+
+  if len(oversold_currencies):
+    raise TradeDataError('The units sold of ' + oversold_currencies[0] + ' exceed the units acquired.  Please correct the input file and try again.')
+
+def create_buy_queues(buy_currencies, buy_order):
+  buy_queues = {}
+
+  for position in buy_order:
+    buy_queues.setdefault(buy_currencies[position], deque()).append(position)
+
+  return buy_queues
 
 def create_buy_and_sell_match_df(buy_df, sell_df, valuation_currencies):
-  primary_valuation_currency = valuation_currencies[0].lower()
-  
-  valuation_columns = get_valuation_columns(['buy_value_', 'sell_value_'], valuation_currencies)
-  
-  buy_and_sell_match_df = pd.DataFrame(columns=['currency', 'quantity', 'buy_date', 'sell_date'] + valuation_columns + ['buy_exchange', 'sell_exchange', 'buy_comment', 'sell_comment'])
-
-  while len(sell_df.index) > 0:
-    sell_row_index = sell_df['trade_date'].idxmin()
-    sell_row = sell_df.loc[sell_row_index]
-    sell_currency = sell_row['sell_currency']
-    buy_row_index = buy_df.loc[buy_df['buy_currency'] == sell_currency, 'trade_date'].idxmin()
-    buy_row = buy_df.loc[buy_row_index]
-    sell_date = sell_row['trade_date']
-    buy_date = buy_row['trade_date']
-    
-    if sell_date < buy_date:
-      print_error_message_and_exit('Sell for ' + sell_currency + ' on ' + str(sell_date) + ' cannot be matched with a buy.  The closest buy occurred at a later date: ' + str(buy_date) + '.  Please correct input file and try again.')
-    
-    buy_quantity = buy_row['buy']
-    sell_quantity = sell_row['sell']
-    match_quantity = min(buy_quantity, sell_quantity)
-    
-    match_dict = {}
-    buy_valuation_columns = get_valuation_columns(['buy_value_'], valuation_currencies)
-    sell_valuation_columns = get_valuation_columns(['sell_value_'], valuation_currencies)
-    
-    for column in buy_valuation_columns:
-      match_dict[column] = calculate_trade_match_value(match_quantity, buy_quantity, buy_row[column])
+  buy_and_sell_match_df, remaining_buy_df = match_buys_and_sells(buy_df, sell_df, valuation_currencies)
 
-    for column in sell_valuation_columns:
-      match_dict[column] = calculate_trade_match_value(match_quantity, sell_quantity, sell_row[column])
+  return combine_matches_and_remaining_buys(buy_and_sell_match_df, remaining_buy_df)
 
-    match_values = [match_dict[column] for column in valuation_columns]
-    
-    if sell_row['comment'].lower().strip() != 'gift':
-      buy_and_sell_match_df.loc[len(buy_and_sell_match_df.index)] = [sell_currency, match_quantity, buy_date, sell_date] + match_values + [buy_row['exchange'], sell_row['exchange'], buy_row['comment'], sell_row['comment']]
-  
-    subtract_match(buy_df, buy_row_index, 'buy', match_quantity, match_dict)
-    subtract_match(sell_df, sell_row_index, 'sell', match_quantity, match_dict)
+def match_buys_and_sells_by_currency(buy_df, sell_df, valuation_currencies, max_workers):
+  if max_workers <= 1 or len(buy_df.index) + len(sell_df.index) < parallel_matching_min_trades:
+    return match_buys_and_sells(buy_df, sell_df, valuation_currencies)
 
-  buy_and_sell_match_df = add_gain_loss_to_df(buy_and_sell_match_df, valuation_currencies)
-  
+  buy_currencies = buy_df['buy_currency'].values.astype(object)
+  sell_currencies = sell_df['sell_currency'].values.astype(object)
+  currency_groups = get_currency_groups(np.concatenate([buy_currencies, sell_currencies]), max_workers)
+
+  if len(currency_groups) < 2:
+    return match_buys_and_sells(buy_df, sell_df, valuation_currencies)
+
+  sell_order = np.argsort(sell_df['trade_date'].values, kind='mergesort')
+  ranked_sell_df = sell_df.iloc[sell_order].reset_index(drop=True)
+  ranked_sell_currencies = sell_currencies[sell_order]
+  positioned_buy_df = buy_df.reset_index(drop=True)
+
+  with ProcessPoolExecutor(max_workers=len(currency_groups)) as executor:
+    futures = [executor.submit(match_buys_and_sells, positioned_buy_df.loc[np.isin(buy_currencies, currency_group)], ranked_sell_df.loc[np.isin(ranked_sell_currencies, currency_group)], valuation_currencies) for currency_group in currency_groups]
+
+    try:
+      matches = [future.result() for future in futures]
+    except TradeDataError:
+      return match_buys_and_sells(buy_df, sell_df, valuation_currencies)
+
+  buy_and_sell_match_df = pd.concat([buy_and_sell_match_df for buy_and_sell_match_df, remaining_buy_df in matches]).sort_index(kind='mergesort').reset_index(drop=True)
+  remaining_buy_df = pd.concat([remaining_buy_df for buy_and_sell_match_df, remaining_buy_df in matches]).sort_index(kind='mergesort')
+  remaining_buy_df.index = buy_df.index[remaining_buy_df.index]
+
+  return buy_and_sell_match_df, remaining_buy_df
+
+def get_currency_groups(currencies, group_count):
+  currency_groups = [[] for i in range(group_count)]
+  group_sizes = [0] * group_count
+
+  for currency, size in pd.Series(currencies).value_counts().items():
+    smallest_group = group_sizes.index(min(group_sizes))
+    currency_groups[smallest_group].append(currency)
+    group_sizes[smallest_group] += size
+
+  return [currency_group for currency_group in currency_groups if currency_group]
+
+def match_buys_and_sells(buy_df, sell_df, valuation_currencies):
+  buy_valuation_columns = get_valuation_columns(['buy_value_'], valuation_currencies)
+  valuation_columns = get_valuation_columns(['buy_value_', 'sell_value_', 'gain_loss_'], valuation_currencies)
+
+  buy_quantities = buy_df['buy'].values.astype(float).tolist()
+  buy_currencies = buy_df['buy_currency'].values.astype(object)
+  buy_dates = buy_df['trade_date'].values
+  buy_exchanges = buy_df['exchange'].values.astype(object)
+  buy_comments = buy_df['comment'].values.astype(object)
+
+  sell_quantities = sell_df['sell'].values.astype(float).tolist()
+  sell_currencies = sell_df['sell_currency'].values.astype(object)
+  sell_dates = sell_df['trade_date'].values
+  sell_exchanges = sell_df['exchange'].values.astype(object)
+  sell_comments = sell_df['comment'].values.astype(object)
+  sell_is_gift = sell_df['comment'].str.lower().str.strip().values == 'gift'
+
+  buy_queues = create_buy_queues(buy_currencies, np.argsort(buy_dates, kind='mergesort'))
+
+  match_count_limit = len(buy_quantities) + len(sell_quantities)
+  match_buy_positions = np.empty(match_count_limit, dtype=np.int64)
+  match_sell_positions = np.empty(match_count_limit, dtype=np.int64)
+  match_quantities = np.empty(match_count_limit, dtype=float)
+  match_buy_ratios = np.empty(match_count_limit, dtype=float)
+  match_sell_ratios = np.empty(match_count_limit, dtype=float)
+  match_count = 0
+
+  for sell_position in np.argsort(sell_dates, kind='mergesort'):
+    sell_currency = sell_currencies[sell_position]
+    sell_date = sell_dates[sell_position]
+    buy_queue = buy_queues.get(sell_currency)
+
+    while sell_quantities[sell_position] != 0:
+      if not buy_queue:
+        raise TradeDataError('The units sold of ' + sell_currency + ' exceed the units acquired.  Please correct the input file and try again.')
+
+      buy_position = buy_queue[0]
+      buy_date = buy_dates[buy_position]
+
+      if sell_date < buy_date:
+        raise TradeDataError('Sell for ' + sell_currency + ' on ' + str(pd.Timestamp(sell_date)) + ' cannot be matched with a buy.  The closest buy occurred at a later date: ' + str(pd.Timestamp(buy_date)) + '.  Please correct input file and try again.')
+
+      buy_quantity = buy_quantities[buy_position]
+      sell_quantity = sell_quantities[sell_position]
+      match_quantity = min(buy_quantity, sell_quantity)
+
+      match_buy_positions[match_count] = buy_position
+      match_sell_positions[match_count] = sell_position
+      match_quantities[match_count] = match_quantity
+      match_buy_ratios[match_count] = match_quantity / buy_quantity
+      match_sell_ratios[match_count] = match_quantity / sell_quantity
+      match_count += 1
+
+      buy_quantities[buy_position] = round_internal_decimal_places(buy_quantity - match_quantity)
+      sell_quantities[sell_position] = round_internal_decimal_places(sell_quantity - match_quantity)
+
+      if buy_quantities[buy_position] == 0:
+        buy_queue.popleft()
+
+  match_buy_positions = match_buy_positions[:match_count]
+  match_sell_positions = match_sell_positions[:match_count]
+
+  buy_values = buy_df[buy_valuation_columns].values.astype(float)
+  match_buy_values = calculate_match_values(match_buy_positions, match_buy_ratios[:match_count], buy_values)
+  match_sell_values = calculate_match_values(match_sell_positions, match_sell_ratios[:match_count], sell_df[get_valuation_columns(['sell_value_'], valuation_currencies)].values.astype(float))
+
+  matched = ~sell_is_gift[match_sell_positions]
+  match_buy_positions = match_buy_positions[matched]
+  match_sell_positions = match_sell_positions[matched]
+  match_values = np.stack([match_buy_values[matched], match_sell_values[matched], match_sell_values[matched] - match_buy_values[matched]], axis=2).reshape(len(match_sell_positions), len(valuation_columns))
+
+  buy_and_sell_match_df = pd.DataFrame(OrderedDict(
+    [
+      ('currency', sell_currencies[match_sell_positions]),
+      ('quantity', match_quantities[:match_count][matched]),
+      ('buy_date', buy_dates[match_buy_positions]),
+      ('sell_date', sell_dates[match_sell_positions])
+      ] + list(zip(valuation_columns, match_values.T)) + [
+      ('buy_exchange', buy_exchanges[match_buy_positions]),
+      ('sell_exchange', sell_exchanges[match_sell_positions]),
+      ('buy_comment', buy_comments[match_buy_positions]),
+      ('sell_comment', sell_comments[match_sell_positions])
+      ]), index=sell_df.index[match_sell_positions])
+
+  remaining_buy_df = create_remaining_buy_df(buy_df, buy_valuation_columns, buy_quantities, buy_values)
+
+  return buy_and_sell_match_df, remaining_buy_df
+
+def calculate_match_values(positions, ratios, values):
+  # The values of all valuation currencies are matched at once, and the nth match of every trade is calculated in the same step
+  match_values = np.empty((len(positions), values.shape[1]), dtype=float)
+  steps = pd.Series(positions).groupby(positions).cumcount().values
+  step_order = np.argsort(steps, kind='mergesort')
+  step_start = 0
+
+  for step_end in np.cumsum(np.bincount(steps)):
+    step_matches = step_order[step_start:step_end]
+    step_positions = positions[step_matches]
+
+    if len(step_matches) < vectorized_match_min_trades:
+      calculate_remaining_match_values(positions, ratios, values, match_values, step_order[step_start:])
+      break
+
+    step_match_values = np.round(ratios[step_matches, np.newaxis] * values[step_positions], internal_decimal_places)
+    match_values[step_matches] = step_match_values
+    values[step_positions] = np.round(values[step_positions] - step_match_values, internal_decimal_places)
+    step_start = step_end
+
+  return match_values
+
+def calculate_remaining_match_values(positions, ratios, values, match_values, matches):
+  trade_values = dict((position, values[position].tolist()) for position in np.unique(positions[matches]).tolist())
+
+  for match, position, ratio in zip(matches.tolist(), positions[matches].tolist(), ratios[matches].tolist()):
+    position_values = trade_values[position]
+    position_match_values = [round_internal_decimal_places(ratio * value) for value in position_values]
+    match_values[match] = position_match_values
+    trade_values[position] = [round_internal_decimal_places(value - match_value) for value, match_value in zip(position_values, position_match_values)]
+
+  for position, position_values in trade_values.items():
+    values[position] = position_values
+
+def combine_matches_and_remaining_buys(buy_and_sell_match_df, remaining_buy_df):
   columns = buy_and_sell_match_df.columns
-  
-  buy_and_sell_match_df = pd.concat([buy_and_sell_match_df, buy_df.rename(columns={'buy':'quantity', 'buy_currency':'currency', 'exchange':'buy_exchange', 'comment':'buy_comment', 'trade_date':'buy_date'})], ignore_index=True)
-  
+
+  buy_and_sell_match_df = pd.concat([buy_and_sell_match_df, remaining_buy_df.rename(columns={'buy':'quantity', 'buy_currency':'currency', 'exchange':'buy_exchange', 'comment':'buy_comment', 'trade_date':'buy_date'})], ignore_index=True)
+
   buy_and_sell_match_df = buy_and_sell_match_df[columns]
 
   buy_and_sell_match_df.sort_values(by=['sell_date', 'buy_date'], ascending=False, inplace=True)
 
   return buy_and_sell_match_df
 
-def calculate_trade_match_value(match_quantity, trade_quantity, trade_valuation):
-  return round((match_quantity / trade_quantity) * trade_valuation, internal_decimal_places)
+def create_remaining_buy_df(buy_df, buy_valuation_columns, buy_quantities, buy_values):
+  buy_quantities = np.array(buy_quantities, dtype=float)
+  remaining = buy_quantities != 0
+  remaining_buy_df = buy_df.loc[remaining].copy()
+  remaining_buy_df['buy'] = buy_quantities[remaining]
+  remaining_buy_df[buy_valuation_columns] = buy_values[remaining]
 
-def subtract_match(df, index, side, match_quantity, match_dict):
-  df.loc[index, side] = round(df.loc[index, side] - match_quantity, internal_decimal_places)
-  for valuation_column in match_dict:
-    if valuation_column in df.columns:
-      df.loc[index, valuation_column] = round(df.loc[index, valuation_column] - match_dict[valuation_column], internal_decimal_places)
-  if df.loc[index, side] == 0:
-    df.drop(index, inplace=True)
+  return remaining_buy_df
 
-def add_gain_loss_to_df(df, valuation_currencies):
-  for currency in valuation_currencies:
-    currency = currency.lower()
-    buy_value_column = 'buy_value_' + currency
-    sell_value_column = 'sell_value_' + currency
-    gain_loss_column = 'gain_loss_' + currency
+def round_internal_decimal_places(value):
+  # Same result as numpy's round() on float64, without the cost of numpy scalars in the matching loop
+  if not math.isfinite(value):
+    return value
+  return round(value * internal_rounding_factor) / internal_rounding_factor
 
-    if gain_loss_column in df.columns:
-      df.drop(gain_loss_column, axis=1, inplace=True)
-    df.insert(df.columns.get_loc(sell_value_column) + 1, gain_loss_column, df[sell_value_column] - df[buy_value_column])
-    
-  return df
+def create_buy_and_sell_match_df_incrementally(input_df, valuation_currencies, cryptocompare_session, price_store, checkpoint_filename, matching_workers=1, exact_rates=False):
+  with instrument_stage('read_checkpoint') as stage:
+    row_hashes = get_row_hashes(input_df)
+    checkpoint, new_rows = read_checkpoint(checkpoint_filename, valuation_currencies, exact_rates, row_hashes, input_df['trade_date'])
+    stage['rows'] = len(row_hashes)
+
+  with instrument_stage('add_trade_valuations') as stage:
+    new_input_df = input_df.loc[new_rows].copy()
+    new_input_df['buy_is_currency_fiat'] = get_are_currencies_fiat(new_input_df['buy_currency'])
+    new_input_df['sell_is_currency_fiat'] = get_are_currencies_fiat(new_input_df['sell_currency'])
+
+    add_trade_valuations_to_input_df(new_input_df, valuation_currencies, cryptocompare_session, price_store)
+    stage['rows'] = len(new_input_df.index)
+
+  with instrument_stage('match_buys_and_sells') as stage:
+    buy_df = pd.concat([checkpoint['remaining_buy_df'], create_buy_or_sell_df(new_input_df, 'buy', valuation_currencies)], ignore_index=True)
+    sell_df = create_buy_or_sell_df(new_input_df, 'sell', valuation_currencies)
+
+    check_for_valid_buy_and_sell_quantities(buy_df, sell_df)
+
+    buy_and_sell_match_df, remaining_buy_df = match_buys_and_sells_by_currency(buy_df, sell_df, valuation_currencies, matching_workers)
+    buy_and_sell_match_df = pd.concat([checkpoint['buy_and_sell_match_df'], buy_and_sell_match_df], ignore_index=True)
+    stage['rows'] = len(buy_df.index) + len(sell_df.index)
+
+  with instrument_stage('write_checkpoint') as stage:
+    write_checkpoint(checkpoint_filename, {
+      'version': checkpoint_version,
+      'valuation_currencies': valuation_currencies,
+      'exact_rates': exact_rates,
+      'row_hashes': row_hashes,
+      'last_trade_date': input_df['trade_date'].max(),
+      'buy_and_sell_match_df': buy_and_sell_match_df,
+      'remaining_buy_df': remaining_buy_df
+      })
+    stage['rows'] = len(buy_and_sell_match_df.index) + len(remaining_buy_df.index)
+
+  return combine_matches_and_remaining_buys(buy_and_sell_match_df, remaining_buy_df)
+
+def get_row_hashes(input_df):
+  return pd.util.hash_pandas_object(input_df[get_required_columns(input_df.columns)], index=False).values
+
+def get_new_rows(row_hashes, processed_row_hashes):
+  processed_counts = pd.Series(processed_row_hashes).value_counts()
+  row_hash_series = pd.Series(row_hashes)
+  occurrences = row_hash_series.groupby(row_hash_series).cumcount()
+
+  return (occurrences >= row_hash_series.map(processed_counts).fillna(0)).values
+
+def read_checkpoint(checkpoint_filename, valuation_currencies, exact_rates, row_hashes, trade_dates):
+  checkpoint = None
+
+  if checkpoint_filename and os.path.exists(checkpoint_filename):
+    try:
+      checkpoint = pd.read_pickle(checkpoint_filename)
+    except:
+      checkpoint = None
+
+  if checkpoint and checkpoint['version'] == checkpoint_version and checkpoint['valuation_currencies'] == valuation_currencies and checkpoint['exact_rates'] == exact_rates:
+    new_rows = get_new_rows(row_hashes, checkpoint['row_hashes'])
+
+    if len(new_rows) - new_rows.sum() == len(checkpoint['row_hashes']) and not (trade_dates[new_rows] <= checkpoint['last_trade_date']).any():
+      return checkpoint, new_rows
+
+  empty_checkpoint = {'row_hashes': np.array([], dtype=np.uint64), 'buy_and_sell_match_df': None, 'remaining_buy_df': None}
+
+  return empty_checkpoint, np.ones(len(row_hashes), dtype=bool)
+
+def write_checkpoint(checkpoint_filename, checkpoint):
+  if checkpoint_filename:
+    pd.to_pickle(checkpoint, checkpoint_filename)
 
 def create_realized_totals_df(buy_and_sell_match_df, pivot_values, margins_name):
-  buy_and_sell_realized_df = buy_and_sell_match_df.copy()
-  buy_and_sell_realized_df['sell_year'] = buy_and_sell_realized_df['sell_date'].dt.year
-  buy_and_sell_realized_df = buy_and_sell_realized_df.loc[buy_and_sell_realized_df['sell_date'].notnull()]
-  pivot_index = ['sell_year', 'currency']
-  
-  realized_totals_df = create_totals_df(buy_and_sell_realized_df, pivot_index, pivot_values, True, margins_name)
-  
-  return realized_totals_df
-  
-def create_totals_df(df, pivot_index, pivot_values, margins, margins_name):
-  totals_df = pd.pivot_table(df, index=pivot_index, values=pivot_values, aggfunc=np.sum, margins=margins, margins_name=margins_name)
+  realized = buy_and_sell_match_df['sell_date'].notnull().values
+  keys = OrderedDict([
+    ('sell_year', buy_and_sell_match_df['sell_date'].dt.year.values[realized]),
+    ('currency', buy_and_sell_match_df['currency'].values[realized])
+    ])
+  values = get_value_array(buy_and_sell_match_df, pivot_values, realized)
 
-  totals_df.reset_index(inplace=True)
-  totals_df = totals_df[pivot_index + pivot_values]
-  first_column = totals_df.columns[0]
-  totals_df.loc[totals_df[first_column] == margins_name, 'quantity'] = np.NaN
+  realized_totals_df = create_totals_df(keys, pivot_values, values)
   
+  return add_margin_totals_to_df(realized_totals_df, list(keys), pivot_values, values, margins_name)
+
+def get_value_array(df, columns, rows):
+  return np.column_stack([df[column].values[rows].astype(float) for column in columns])
+
+def create_totals_df(keys, pivot_values, values):
+  group_codes = np.zeros(len(values), dtype=np.int64)
+
+  for key_values in keys.values():
+    codes, uniques = pd.factorize(key_values, sort=True)
+    group_codes = group_codes * len(uniques) + codes
+
+  unique_group_codes, first_rows, group_positions = np.unique(group_codes, return_index=True, return_inverse=True)
+  totals_df = pd.DataFrame(OrderedDict((key, key_values[first_rows]) for key, key_values in keys.items()))
+
+  for i, column in enumerate(pivot_values):
+    totals_df[column] = np.bincount(group_positions.ravel(), weights=np.where(np.isnan(values[:, i]), 0, values[:, i]), minlength=len(first_rows))
+
   return totals_df
 
+def add_margin_totals_to_df(totals_df, pivot_index, pivot_values, values, margins_name):
+  margin_totals = values[~np.isnan(values).any(axis=1)].sum(axis=0)
+  margin_totals_df = pd.DataFrame([[margins_name] + [''] * (len(pivot_index) - 1) + list(margin_totals)], columns=pivot_index + pivot_values)
+  margin_totals_df['quantity'] = np.nan
+
+  return pd.concat([totals_df, margin_totals_df], ignore_index=True)
+
 def create_average_prices_df(totals_df, columns, margins_name):
-  totals_df = totals_df.copy()
+  average_prices_df = totals_df.loc[(totals_df[totals_df.columns[0]] != margins_name).values]
+  average_prices_df[columns] = average_prices_df[columns].values / average_prices_df[['quantity']].values
   
-  for column in columns:
-    totals_df[column] = totals_df[column] / totals_df['quantity']
+  return average_prices_df
 
-  first_column = totals_df.columns[0]
-  totals_df = totals_df[totals_df[first_column] != 'Total']
-  
-  return totals_df
+def create_unrealized_totals_df(buy_and_sell_match_df, pivot_values, valuation_currencies, margins_name, coinmarketcap_session, current_prices=None):
+  unrealized = buy_and_sell_match_df['sell_date'].isnull().values
+  keys = OrderedDict([('currency', buy_and_sell_match_df['currency'].values[unrealized])])
 
-def create_unrealized_totals_df(buy_and_sell_match_df, pivot_values, valuation_currencies, margins_name, coinmarketcap_session):
-  unrealized_totals_df = create_totals_df(buy_and_sell_match_df.loc[buy_and_sell_match_df['sell_date'].isnull()], ['currency'], pivot_values, False, margins_name)
+  unrealized_totals_df = create_totals_df(keys, pivot_values, get_value_array(buy_and_sell_match_df, pivot_values, unrealized))
 
-  coinmarketcap_id_dict = get_coinmarketcap_ids(coinmarketcap_session)
+  if current_prices is None:
+    coinmarketcap_id_dict = get_coinmarketcap_ids(coinmarketcap_session)
+    current_prices = get_coinmarketcap_current_prices(unrealized_totals_df['currency'], valuation_currencies, coinmarketcap_id_dict, coinmarketcap_session)
   
   for currency in valuation_currencies:
     currency = currency.lower()
-    unrealized_totals_df['sell_value_' + currency] = unrealized_totals_df.apply(lambda row : row['quantity'] * get_coinmarketcap_current_price(row['currency'], currency, coinmarketcap_id_dict, coinmarketcap_session), axis=1)
-  
-  unrealized_totals_df = add_gain_loss_to_df(unrealized_totals_df, valuation_currencies)
+    unrealized_totals_df['sell_value_' + currency] = unrealized_totals_df['quantity'].values * np.array([current_prices[(from_currency.upper(), currency.upper())] for from_currency in unrealized_totals_df['currency']], dtype=float)
+    unrealized_totals_df['gain_loss_' + currency] = unrealized_totals_df['sell_value_' + currency] - unrealized_totals_df['buy_value_' + currency]
   
-  unrealized_totals_df = create_totals_df(unrealized_totals_df, ['currency'], pivot_values, True, margins_name)
-  
-  return unrealized_totals_df
+  return add_margin_totals_to_df(unrealized_totals_df, list(keys), pivot_values, unrealized_totals_df[pivot_values].values, margins_name)
 
 def get_coinmarketcap_ids(coinmarketcap_session):
+  coinmarketcap_id_dict = read_coinmarketcap_id_file(coinmarketcap_id_filename, coinmarketcap_id_max_age)
+
+  if coinmarketcap_id_dict is None:
+    try:
+      with coinmarketcap_session.cache_disabled():
+        response = get_request(coinmarketcap_session, coinmarketcap_api_base_url + 'listings/')
+
+      coinmarketcap_id_dict = {}
+
+      for coin in response.json()['data']:
+        coinmarketcap_id_dict[coin['symbol'].upper()] = coin['id']
+    except:
+      raise PriceDataError('The program encountered an error while trying to retrieve coin IDs from the CoinMarketCap API.  Please try running the program again later.')
+
+    write_coinmarketcap_id_file(coinmarketcap_id_filename, coinmarketcap_id_dict)
+
+  return coinmarketcap_id_dict
+
+def get_coinmarketcap_id(coinmarketcap_id_dict, currency):
+  return coinmarketcap_id_overrides.get(currency, coinmarketcap_id_dict.get(currency))
+
+def read_coinmarketcap_id_file(id_filename, max_age):
+  if not id_filename or not os.path.exists(id_filename):
+    return None
+
+  try:
+    with open(id_filename) as id_file:
+      id_file_json = json.load(id_file)
+  except:
+    return None
+
+  if time.time() - id_file_json['fetched_at'] > max_age:
+    return None
+
+  return id_file_json['ids']
+
+def write_coinmarketcap_id_file(id_filename, coinmarketcap_id_dict):
+  if id_filename:
+    with open(id_filename, 'w') as id_file:
+      json.dump({'fetched_at': int(time.time()), 'ids': coinmarketcap_id_dict}, id_file)
+
+def get_coinmarketcap_current_prices(from_currencies, to_currencies, coinmarketcap_id_dict, coinmarketcap_session):
+  current_prices = {}
+  price_keys = []
+  now = time.time()
+
+  for from_currency in from_currencies:
+    from_currency = from_currency.upper()
+
+    if get_coinmarketcap_id(coinmarketcap_id_dict, from_currency):
+      for to_currency in to_currencies:
+        price_key = (from_currency, to_currency.upper())
+        price, fetched_at = current_price_quotes.get(price_key, (None, 0))
+
+        if now - fetched_at <= current_price_max_age:
+          current_prices[price_key] = price
+        else:
+          price_keys.append(price_key)
+    else:
+      print('\n' + 'CoinMarketCap does not have the current price for ' + from_currency + '.  The currency will have a current value of zero in the output file.')
+      for to_currency in to_currencies:
+        current_prices[(from_currency, to_currency.upper())] = 0
+
+  if price_keys:
+    fetched_prices = fetch_coinmarketcap_current_prices(price_keys, coinmarketcap_id_dict, coinmarketcap_session)
+    current_price_quotes.update((price_key, (price, now)) for price_key, price in fetched_prices.items())
+    current_prices.update(fetched_prices)
+
+  return current_prices
+
+def fetch_coinmarketcap_current_prices(price_keys, coinmarketcap_id_dict, coinmarketcap_session):
+  # Ticker pages are numbered by the position of each ID in the listings, so IDs that are only in the overrides are requested one by one
+  id_positions = dict((coin_id, position) for position, coin_id in enumerate(sorted(set(coinmarketcap_id_dict.values()))))
+  coin_ids = dict((from_currency, get_coinmarketcap_id(coinmarketcap_id_dict, from_currency)) for from_currency, to_currency in price_keys)
+  converts = sorted(set(to_currency for from_currency, to_currency in price_keys).difference(['USD'])) or ['USD']
+  ticker_starts = {}
+
+  for from_currency, to_currency in price_keys:
+    # Every ticker page includes USD quotes, so USD prices are read from the pages of another conversion
+    convert = to_currency if to_currency in converts else converts[0]
+    if coin_ids[from_currency] in id_positions:
+      ticker_starts.setdefault(convert, set()).add(id_positions[coin_ids[from_currency]] // coinmarketcap_ticker_limit * coinmarketcap_ticker_limit + 1)
+
+  urls = [coinmarketcap_api_base_url + 'ticker/?start=' + str(start) + '&limit=' + str(coinmarketcap_ticker_limit) + '&sort=id&structure=array&convert=' + convert for convert, starts in sorted(ticker_starts.items()) for start in sorted(starts)]
+  quotes = {}
+
   try:
     with coinmarketcap_session.cache_disabled():
-      response = get_request(coinmarketcap_session, coinmarketcap_api_base_url + 'listings/')
+      responses = get_requests(coinmarketcap_session, urls)
 
-  except:
-    print_error_message_and_exit('The program encountered an error while trying to retrieve coin IDs from the CoinMarketCap API.  Please try running the program again later.')
+    for response in responses:
+      for coin in response.json()['data']:
+        for to_currency, quote in coin['quotes'].items():
+          if quote.get('price') is not None:
+            quotes[(coin['id'], to_currency.upper())] = float(quote['price'])
 
-  coinmarketcap_id_dict = {}
-    
-  for coin in response.json()['data']:
-    coinmarketcap_id_dict[coin['symbol'].upper()] = coin['id']
-    
-  coinmarketcap_id_dict['CPC'] = 2482
+    missing_price_keys = [(from_currency, to_currency) for from_currency, to_currency in price_keys if (coin_ids[from_currency], to_currency) not in quotes]
+    urls = [coinmarketcap_api_base_url + 'ticker/' + str(coin_ids[from_currency]) + '/?convert=' + to_currency for from_currency, to_currency in missing_price_keys]
 
-  return coinmarketcap_id_dict
+    with coinmarketcap_session.cache_disabled():
+      responses = get_requests(coinmarketcap_session, urls)
 
-def get_coinmarketcap_current_price(from_currency, to_currency, coinmarketcap_id_dict, coinmarketcap_session):
-  coinmarketcap_id = coinmarketcap_id_dict.get(from_currency.upper())
+    for (from_currency, to_currency), response in zip(missing_price_keys, responses):
+      quotes[(coin_ids[from_currency], to_currency)] = float(response.json()['data']['quotes'][to_currency]['price'])
+  except:
+    raise PriceDataError('The program encountered an error while trying to retrieve current prices from the CoinMarketCap.com API.  Please try running the program again later.')
 
-  if coinmarketcap_id:
-    to_currency = to_currency.upper()
-    try:
-      with requests_cache.disabled():
-        response = get_request(coinmarketcap_session, coinmarketcap_api_base_url + 'ticker/' + str(coinmarketcap_id) +  '/?convert=' + to_currency)
-    except:
-      print_error_message_and_exit('The program encountered an error while trying to retrieve current prices from the CoinMarketCap.com API.  Please try running the program again later.')
-    current_price = float(response.json()['data']['quotes'][to_currency]['price'])
-  else:
-    print('\n' + 'CoinMarketCap does not have the current price for ' + from_currency + '.  The currency will have a current value of zero in the output file.')
-    current_price = 0
-  time.sleep(1)
-  return current_price
+  return dict(((from_currency, to_currency), quotes[(coin_ids[from_currency], to_currency)]) for from_currency, to_currency in price_keys)
   
-def format_excel_sheet(df, sheet):
-  max_width_list = [len(column) + 2 for column in df.columns]
+def format_excel_sheet(columns, row_count, sheet):
+  max_width_list = [len(column) + 2 for column in columns]
   for i, width in enumerate(max_width_list):
     sheet.set_column(i, i, width)
   
-  sheet.autofilter(0, 0, len(df.index) - 1, len(df.columns) - 1)
+  sheet.autofilter(0, 0, row_count - 1, len(columns) - 1)
   sheet.freeze_panes(1, 0)
 
-def write_excel_sheet(df, writer, sheet_name):
-  df.to_excel(writer, sheet_name = sheet_name, index=False)
-  format_excel_sheet(df, writer.sheets[sheet_name])
-  
-  return writer
+def write_excel_sheet(df, workbook, sheet_name):
+  df_chunks = (df.iloc[i:i + input_chunk_size] for i in range(0, len(df.index), input_chunk_size))
+
+  return write_excel_chunks(df_chunks, df.columns, workbook, sheet_name)
+
+def write_input_sheet(input_filename, workbook, sheet_name):
+  columns = pd.read_csv(input_filename, nrows=0).columns
+  numeric_columns = get_numeric_input_columns(input_filename)
+  input_chunks = (convert_numeric_input_columns(input_chunk, numeric_columns) for input_chunk in pd.read_csv(input_filename, dtype=str, na_filter=False, chunksize=input_chunk_size))
+
+  return write_excel_chunks(input_chunks, columns, workbook, sheet_name)
+
+def get_numeric_input_columns(input_filename):
+  # Column types are inferred from the whole file, so every chunk of a column is written as the same type
+  numeric_columns = None
+
+  for input_chunk in pd.read_csv(input_filename, dtype=str, na_filter=False, chunksize=input_chunk_size):
+    chunk_numeric_columns = [column for column in input_chunk.columns if pd.to_numeric(input_chunk[column], errors='coerce').notnull().all()]
+    numeric_columns = chunk_numeric_columns if numeric_columns is None else [column for column in numeric_columns if column in chunk_numeric_columns]
+
+  return numeric_columns or []
 
-def output_excel_file(writer, excel_output_filename):
+def convert_numeric_input_columns(input_chunk, numeric_columns):
+  for column in numeric_columns:
+    input_chunk[column] = pd.to_numeric(input_chunk[column])
+
+  return input_chunk
+
+def write_excel_chunks(df_chunks, columns, workbook, sheet_name):
+  sheet = add_excel_sheet(columns, workbook, sheet_name)
+  sheet_count = 1
+  row_count = 0
+
+  for df_chunk in df_chunks:
+    for row in get_excel_rows(df_chunk):
+      if row_count == excel_max_rows - 1:
+        format_excel_sheet(columns, row_count, sheet)
+        sheet_count += 1
+        sheet = add_excel_sheet(columns, workbook, sheet_name + '_' + str(sheet_count))
+        row_count = 0
+
+      row_count += 1
+      sheet.write_row(row_count, 0, row)
+
+  format_excel_sheet(columns, row_count, sheet)
+
+  return workbook
+
+def add_excel_sheet(columns, workbook, sheet_name):
+  sheet = workbook.add_worksheet(sheet_name)
+  sheet.write_row(0, 0, list(columns))
+
+  return sheet
+
+def get_excel_rows(df):
+  df = format_output_dates(df).astype(object)
+
+  return df.where(df.notnull(), None).values.tolist()
+
+def format_output_dates(df):
+  date_columns = [column for column in df.columns if pd.api.types.is_datetime64_any_dtype(df[column])]
+
+  if date_columns:
+    df = df.copy()
+    for column in date_columns:
+      df[column] = df[column].dt.strftime('%Y-%m-%dT%H:%M:%S+00:00').replace('NaT', '')
+
+  return df
+
+def format_columnar_df(df):
+  df = df.reset_index(drop=True)
+
+  for column in df.columns:
+    if df[column].dtype == object:
+      df[column] = df[column].where(df[column].isnull(), df[column].astype(str))
+
+  return df
+
+def output_excel_file(workbook, excel_output_filename):
   try:
-    writer.save()
+    workbook.close()
   except:
-    print_error_message_and_exit('\n' + 'The program encountered an error while trying to write the Excel output file named "' + excel_output_filename + '".  Please ensure this file is closed and try running the program again.')
+    raise OutputFileError('\n' + 'The program encountered an error while trying to write the Excel output file named "' + excel_output_filename + '".  Please ensure this file is closed and try running the program again.')
 
-def main():
-  cryptocompare_session = retry_session(cryptocompare_api_base_url, error_codes, expire_after=None)
-  coinmarketcap_session = retry_session(coinmarketcap_api_base_url, error_codes, expire_after=120)
-  
-  valuation_cryptocurrencies = get_valuation_cryptocurrencies(cryptocompare_session)
-  
-  input_df = read_input_file(cointracking_input_filename)
-  original_input_df = input_df.copy()
-  input_df.columns = format_columns(input_df.columns)
-  
-  primary_valuation_currency = get_primary_valuation_currency(input_df.columns)
+def write_table_file(df, table_name, output_format, excel_output_filename):
+  output_filename = os.path.splitext(excel_output_filename)[0] + '_' + table_name + '.' + output_format
 
-  valuation_currencies = [primary_valuation_currency] + valuation_cryptocurrencies
-  
-  check_for_required_columns(input_df.columns)
-  
-  input_df = format_values(input_df)
+  try:
+    if output_format == 'csv':
+      format_output_dates(df).to_csv(output_filename, index=False)
+    elif output_format == 'parquet':
+      format_columnar_df(df).to_parquet(output_filename, index=False)
+    else:
+      format_columnar_df(df).to_feather(output_filename)
+  except:
+    raise OutputFileError('\n' + 'The program encountered an error while trying to write the output file named "' + output_filename + '".  Please ensure this file is closed, and that the pyarrow package is installed for Parquet and Arrow output, and try running the program again.')
 
-  input_df['buy_is_currency_fiat'] = input_df['buy_currency'].apply(lambda x : get_is_currency_fiat(x))
-  
-  input_df['sell_is_currency_fiat'] = input_df['sell_currency'].apply(lambda x : get_is_currency_fiat(x))
-  
-  add_trade_valuations_to_input_df(input_df, valuation_currencies, cryptocompare_session)
-  
-  buy_df = create_buy_or_sell_df(input_df, 'buy', valuation_currencies)
-  sell_df = create_buy_or_sell_df(input_df, 'sell', valuation_currencies)
-  
-  check_for_valid_buy_and_sell_quantities(buy_df, sell_df)
-  
-  buy_and_sell_match_df = create_buy_and_sell_match_df(buy_df, sell_df, valuation_currencies)
-  
-  valuation_columns = get_valuation_columns(['buy_value_', 'sell_value_', 'gain_loss_'], valuation_currencies)
-  pivot_values = ['quantity'] + valuation_columns
-  margins_name = 'Total'
-  
-  realized_totals_df = create_realized_totals_df(buy_and_sell_match_df, pivot_values, margins_name)
-  realized_average_prices_df = create_average_prices_df(realized_totals_df, valuation_columns, margins_name)
-  
-  unrealized_totals_df = create_unrealized_totals_df(buy_and_sell_match_df, pivot_values, valuation_currencies, margins_name, coinmarketcap_session)
-  unrealized_average_prices_df = create_average_prices_df(unrealized_totals_df, valuation_columns, margins_name)
-  
-  buy_and_sell_match_df = buy_and_sell_match_df.round(8)
-  buy_and_sell_match_df['buy_date'] = buy_and_sell_match_df['buy_date'].dt.strftime('%Y-%m-%dT%H:%M:%S+00:00').replace('NaT', '')
-  buy_and_sell_match_df['sell_date'] = buy_and_sell_match_df['sell_date'].dt.strftime('%Y-%m-%dT%H:%M:%S+00:00').replace('NaT', '')
-  realized_totals_df = realized_totals_df.round(8)
-  realized_average_prices_df = realized_average_prices_df.round(8)
-  unrealized_totals_df = unrealized_totals_df.round(8)
-  unrealized_average_prices_df = unrealized_average_prices_df.round(8)
-  
-  writer = pd.ExcelWriter(excel_output_filename, engine='xlsxwriter')
-  write_excel_sheet(original_input_df, writer, 'input')
-  write_excel_sheet(buy_and_sell_match_df, writer, 'buy_and_sell_match')
-  write_excel_sheet(realized_totals_df, writer, 'realized_totals')
-  write_excel_sheet(realized_average_prices_df, writer, 'realized_average_prices')
-  write_excel_sheet(unrealized_totals_df, writer, 'unrealized_totals')
-  write_excel_sheet(unrealized_average_prices_df, writer, 'unrealized_average_prices')
-  
-  output_excel_file(writer, excel_output_filename)
+  return output_filename
+
+def check_output_formats(output_formats):
+  unsupported_output_formats = [output_format for output_format in output_formats if output_format not in supported_output_formats]
+
+  if unsupported_output_formats:
+    raise OutputFileError('The following output formats are not supported: ' + ', '.join(unsupported_output_formats) + '.  Please use one or more of the following output formats: ' + ', '.join(supported_output_formats) + '.')
+
+def write_output_files(input_file_or_df, tables, output_formats, excel_output_filename):
+  check_output_formats(output_formats)
+
+  output_filenames = []
+
+  for output_format in output_formats:
+    if output_format == 'xlsx':
+      workbook = xlsxwriter.Workbook(excel_output_filename, {'constant_memory': True, 'nan_inf_to_errors': True})
+      if isinstance(input_file_or_df, pd.DataFrame):
+        write_excel_sheet(input_file_or_df, workbook, 'input')
+      elif input_file_or_df is not None:
+        write_input_sheet(input_file_or_df, workbook, 'input')
+      for table_name, df in tables.items():
+        write_excel_sheet(df, workbook, table_name)
+      output_excel_file(workbook, excel_output_filename)
+      output_filenames.append(excel_output_filename)
+    else:
+      for table_name, df in tables.items():
+        output_filenames.append(write_table_file(df, table_name, output_format, excel_output_filename))
+
+  return output_filenames
+
+def create_portfolio_tables(input_file_or_df, valuation_cryptocurrencies, cryptocompare_session=None, coinmarketcap_session=None, price_store=None, checkpoint_filename=None, table_names=None, cache_directory=None):
+  table_names = list(table_graph) if table_names is None else table_names
+  check_table_names(table_names, list(table_graph))
+
+  if cryptocompare_session is None:
+    cryptocompare_session = create_cryptocompare_session()
+  if coinmarketcap_session is None:
+    coinmarketcap_session = create_coinmarketcap_session()
+  if price_store is None:
+    price_store = open_price_store(price_store_filename)
+
+  pipeline = create_portfolio_pipeline(input_file_or_df, valuation_cryptocurrencies, cryptocompare_session, coinmarketcap_session, price_store, checkpoint_filename, cache_directory)
+
+  return round_portfolio_tables(get_portfolio_tables(pipeline, table_names))
+
+def check_table_names(table_names, supported_table_names):
+  unsupported_table_names = [table_name for table_name in table_names if table_name not in supported_table_names]
+
+  if unsupported_table_names:
+    raise OutputFileError('The following tables are not supported: ' + ', '.join(unsupported_table_names) + '.  Please use one or more of the following tables: ' + ', '.join(supported_table_names) + '.')
 
-  print('\n' + 'Successfully generated ' + excel_output_filename)
+def create_portfolio_pipeline(input_file_or_df, valuation_cryptocurrencies, cryptocompare_session, coinmarketcap_session, price_store, checkpoint_filename=None, cache_directory=None):
+  valuation_cryptocurrencies = check_valuation_cryptocurrencies(valuation_cryptocurrencies, cryptocompare_session)
+  valuation_currencies = [get_primary_valuation_currency(read_input_columns(input_file_or_df))] + valuation_cryptocurrencies
+
+  return create_table_pipeline(input_file_or_df, valuation_currencies, cryptocompare_session, coinmarketcap_session, price_store, checkpoint_filename, cache_directory, matching_workers=matching_workers)
+
+def create_table_pipeline(input_file_or_df, valuation_currencies, cryptocompare_session, coinmarketcap_session, price_store, checkpoint_filename=None, cache_directory=None, matching_workers=1, exact_rates=False, input_df=None, current_prices=None):
+  return {
+    'input_file_or_df': input_file_or_df,
+    'input_df': input_df,
+    'valuation_currencies': valuation_currencies,
+    'cryptocompare_session': cryptocompare_session,
+    'coinmarketcap_session': coinmarketcap_session,
+    'price_store': price_store,
+    'current_prices': current_prices,
+    'checkpoint_filename': checkpoint_filename,
+    'matching_workers': matching_workers,
+    'exact_rates': exact_rates,
+    'cache_directory': cache_directory,
+    'cache_key': get_table_cache_key(input_file_or_df, valuation_currencies) if cache_directory else None,
+    'tables': {}
+    }
+
+def get_portfolio_tables(pipeline, table_names):
+  return OrderedDict((table_name, get_portfolio_table(pipeline, table_name)) for table_name in table_names)
+
+def get_portfolio_table(pipeline, table_name):
+  if table_name not in pipeline['tables']:
+    df = read_table_cache(pipeline, table_name)
+
+    if df is None:
+      table_builder, dependencies = table_graph[table_name]
+      df = table_builder(pipeline, *[get_portfolio_table(pipeline, dependency) for dependency in dependencies])
+      write_table_cache(pipeline, table_name, df)
+
+    pipeline['tables'][table_name] = df
+
+  return pipeline['tables'][table_name]
+
+def create_buy_and_sell_match_table(pipeline):
+  input_df = pipeline['input_df']
+
+  if input_df is None:
+    with instrument_stage('read_input_file') as stage:
+      if isinstance(pipeline['input_file_or_df'], pd.DataFrame):
+        input_df = format_input_df(pipeline['input_file_or_df'])
+      else:
+        input_df = read_input_file(pipeline['input_file_or_df'])
+      stage['rows'] = len(input_df.index)
+
+  return create_buy_and_sell_match_df_incrementally(input_df, pipeline['valuation_currencies'], pipeline['cryptocompare_session'], pipeline['price_store'], pipeline['checkpoint_filename'], pipeline['matching_workers'], pipeline['exact_rates'])
+
+def create_realized_totals_table(pipeline, buy_and_sell_match_df):
+  with instrument_stage('create_realized_totals') as stage:
+    stage['rows'] = len(buy_and_sell_match_df.index)
+    return create_realized_totals_df(buy_and_sell_match_df, get_pivot_values(pipeline['valuation_currencies']), margins_name)
+
+def create_unrealized_totals_table(pipeline, buy_and_sell_match_df):
+  with instrument_stage('create_unrealized_totals') as stage:
+    stage['rows'] = len(buy_and_sell_match_df.index)
+    return create_unrealized_totals_df(buy_and_sell_match_df, get_pivot_values(pipeline['valuation_currencies']), pipeline['valuation_currencies'], margins_name, pipeline['coinmarketcap_session'], pipeline['current_prices'])
+
+def create_average_prices_table(pipeline, totals_df):
+  return create_average_prices_df(totals_df, get_pivot_values(pipeline['valuation_currencies'])[1:], margins_name)
+
+def get_pivot_values(valuation_currencies):
+  return ['quantity'] + get_valuation_columns(['buy_value_', 'sell_value_', 'gain_loss_'], valuation_currencies)
+
+def get_table_cache_key(input_file_or_df, valuation_currencies):
+  cache_key = hashlib.sha256(json.dumps([table_cache_version, valuation_currencies]).encode('utf-8'))
+
+  if isinstance(input_file_or_df, pd.DataFrame):
+    cache_key.update(json.dumps([str(column) for column in input_file_or_df.columns]).encode('utf-8'))
+    cache_key.update(pd.util.hash_pandas_object(input_file_or_df, index=False).values.tobytes())
+  else:
+    try:
+      with open(input_file_or_df, 'rb') as input_file:
+        for input_bytes in iter(lambda: input_file.read(1048576), b''):
+          cache_key.update(input_bytes)
+    except OSError:
+      raise InputFileError(get_input_file_error_message(input_file_or_df))
+
+  return cache_key.hexdigest()
+
+def read_table_cache(pipeline, table_name):
+  if pipeline['cache_directory'] is None or table_name in live_tables:
+    return None
+
+  table_cache = None
+  table_cache_filename = os.path.join(pipeline['cache_directory'], table_name + '.pkl')
+
+  if os.path.exists(table_cache_filename):
+    try:
+      table_cache = pd.read_pickle(table_cache_filename)
+    except:
+      table_cache = None
+
+  if table_cache and table_cache['key'] == pipeline['cache_key']:
+    record_instrumentation_counter('table_cache_hits')
+    return table_cache['df']
+
+  record_instrumentation_counter('table_cache_misses')
+
+  return None
+
+def write_table_cache(pipeline, table_name, df):
+  if pipeline['cache_directory'] is None or table_name in live_tables:
+    return
+
+  os.makedirs(pipeline['cache_directory'], exist_ok=True)
+  pd.to_pickle({'key': pipeline['cache_key'], 'df': df}, os.path.join(pipeline['cache_directory'], table_name + '.pkl'))
+
+def round_portfolio_tables(tables):
+  return OrderedDict((table_name, df.round(8)) for table_name, df in tables.items())
+
+def run_batch(input_directory, output_directory, valuation_cryptocurrencies, output_formats, cryptocompare_session, coinmarketcap_session, price_store, incremental=True, max_workers=None, exact_rates=False):
+  valuation_cryptocurrencies = check_valuation_cryptocurrencies(valuation_cryptocurrencies, cryptocompare_session)
+  input_filenames = sorted(glob.glob(os.path.join(input_directory, '*.csv')))
+
+  if not input_filenames:
+    raise InputFileError('The input directory ' + input_directory + ' does not contain any CSV files.  Please place the CoinTracking.info trade lists in the input directory and run the program again.')
+
+  os.makedirs(output_directory, exist_ok=True)
+  errors = {}
+
+  with ProcessPoolExecutor(max_workers=max_workers, initializer=disable_instrumentation) as executor:
+    with instrument_stage('read_input_files') as stage:
+      input_dfs = collect_batch_results(input_filenames, [executor.submit(read_input_file, input_filename) for input_filename in input_filenames], errors)
+      valuation_currencies = OrderedDict((input_filename, [get_primary_valuation_currency(input_df.columns)] + valuation_cryptocurrencies) for input_filename, input_df in input_dfs.items())
+      stage['rows'] = sum(len(input_df.index) for input_df in input_dfs.values())
+
+    with instrument_stage('prefetch_cryptocompare_prices') as stage:
+      close_prices = prefetch_cryptocompare_hourly_close_prices(input_dfs, valuation_currencies, cryptocompare_session, price_store, exact_rates)
+      stage['rows'] = sum(len(pair_close_prices.index) for pair_close_prices in close_prices.values())
+
+    with instrument_stage('match_buys_and_sells') as stage:
+      futures = [executor.submit(create_batch_realized_tables, input_df, valuation_currencies[input_filename], close_prices, get_batch_output_filename(output_directory, input_filename, '_checkpoint.pkl') if incremental else None, exact_rates) for input_filename, input_df in input_dfs.items()]
+      realized_tables = collect_batch_results(list(input_dfs), futures, errors)
+      stage['rows'] = sum(len(tables['buy_and_sell_match'].index) for tables in realized_tables.values())
+
+    with instrument_stage('get_coinmarketcap_prices') as stage:
+      current_prices = get_batch_current_prices(realized_tables, valuation_currencies, coinmarketcap_session)
+      stage['rows'] = len(current_prices)
+
+    with instrument_stage('write_output_files') as stage:
+      futures = [executor.submit(write_batch_output_files, input_filename, tables, valuation_currencies[input_filename], current_prices, output_formats, get_batch_output_filename(output_directory, input_filename, '.xlsx')) for input_filename, tables in realized_tables.items()]
+      output_filenames = collect_batch_results(list(realized_tables), futures, errors)
+      stage['rows'] = sum(len(tables['buy_and_sell_match'].index) for tables in realized_tables.values())
+
+  return OrderedDict((input_filename, errors.get(input_filename, output_filenames.get(input_filename))) for input_filename in input_filenames)
+
+def collect_batch_results(input_filenames, futures, errors):
+  results = OrderedDict()
+
+  for input_filename, future in zip(input_filenames, futures):
+    try:
+      results[input_filename] = future.result()
+    except PortfolioDataError as error:
+      errors[input_filename] = error
+    except Exception as error:
+      errors[input_filename] = PortfolioDataError('The program encountered an unexpected error while processing the trade list (' + type(error).__name__ + ': ' + str(error) + ').  Please check the trade list and try running the program again.')
+
+  return results
+
+def get_batch_output_filename(output_directory, input_filename, suffix):
+  return os.path.join(output_directory, os.path.splitext(os.path.basename(input_filename))[0] + suffix)
+
+def prefetch_cryptocompare_hourly_close_prices(input_dfs, valuation_currencies, cryptocompare_session, price_store, exact_rates=False):
+  pair_hours = OrderedDict()
+
+  for input_filename, input_df in input_dfs.items():
+    primary_valuation_currency = valuation_currencies[input_filename][0].upper()
+    unique_trade_hours = np.unique(get_trade_hours(input_df['trade_date']))
+    hours = np.union1d(unique_trade_hours - seconds_per_hour, unique_trade_hours)
+
+    for valuation_currency in valuation_currencies[input_filename][1:]:
+      pair = (primary_valuation_currency, valuation_currency.upper())
+      if pair[0] != pair[1]:
+        pair_hours[pair] = np.union1d(pair_hours.get(pair, hours[:0]), hours)
+
+  return get_cryptocompare_hourly_close_rates(pair_hours, cryptocompare_session, price_store, exact_rates)
+
+def create_batch_realized_tables(input_df, valuation_currencies, close_prices, checkpoint_filename, exact_rates=False):
+  price_store = open_price_store(':memory:')
+  load_price_store(price_store, close_prices)
+
+  pipeline = create_table_pipeline(None, valuation_currencies, None, None, price_store, checkpoint_filename, exact_rates=exact_rates, input_df=input_df)
+
+  return get_portfolio_tables(pipeline, realized_table_names)
+
+def get_batch_current_prices(realized_tables, valuation_currencies, coinmarketcap_session):
+  from_currencies = set()
+  to_currencies = set()
+
+  for input_filename, tables in realized_tables.items():
+    buy_and_sell_match_df = tables['buy_and_sell_match']
+    from_currencies.update(buy_and_sell_match_df.loc[buy_and_sell_match_df['sell_date'].isnull(), 'currency'].astype(str).str.upper())
+    to_currencies.update(currency.upper() for currency in valuation_currencies[input_filename])
+
+  if not from_currencies:
+    return {}
+
+  coinmarketcap_id_dict = get_coinmarketcap_ids(coinmarketcap_session)
+
+  return get_coinmarketcap_current_prices(sorted(from_currencies), sorted(to_currencies), coinmarketcap_id_dict, coinmarketcap_session)
+
+def write_batch_output_files(input_filename, tables, valuation_currencies, current_prices, output_formats, excel_output_filename):
+  pipeline = create_table_pipeline(input_filename, valuation_currencies, None, None, None, current_prices=current_prices)
+  pipeline['tables'].update(tables)
+
+  return write_output_files(input_filename, round_portfolio_tables(get_portfolio_tables(pipeline, table_graph)), output_formats, excel_output_filename)
+
+def start_instrumentation(profile_directory=None):
+  global instrumentation
+
+  if profile_directory:
+    os.makedirs(profile_directory, exist_ok=True)
+
+  instrumentation = {
+    'started_at': time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime()),
+    'start_time': time.perf_counter(),
+    'start_cpu_time': time.process_time(),
+    'profile_directory': profile_directory,
+    'counters': OrderedDict((counter_name, 0) for counter_name in instrumentation_counter_names),
+    'stages': OrderedDict(),
+    'lock': threading.Lock()
+    }
+
+def stop_instrumentation():
+  global instrumentation
+
+  report = OrderedDict([
+    ('started_at', instrumentation['started_at']),
+    ('wall_seconds', time.perf_counter() - instrumentation['start_time']),
+    ('cpu_seconds', time.process_time() - instrumentation['start_cpu_time']),
+    ('peak_rss_mb', get_peak_rss_mb())
+    ])
+  report.update(instrumentation['counters'])
+  report['stages'] = instrumentation['stages']
+  instrumentation = None
+
+  return report
+
+def disable_instrumentation():
+  global instrumentation
+
+  instrumentation = None
+
+@contextmanager
+def instrument_stage(stage_name):
+  if instrumentation is None:
+    yield {}
+    return
+
+  stage = OrderedDict([('rows', None)])
+  start_counters = dict(instrumentation['counters'])
+  start_time = time.perf_counter()
+  start_cpu_time = time.process_time()
+  profile = cProfile.Profile() if instrumentation['profile_directory'] else None
+
+  if profile:
+    profile.enable()
+
+  try:
+    yield stage
+  finally:
+    if profile:
+      profile.disable()
+      stage['profile'] = os.path.join(instrumentation['profile_directory'], stage_name + '.prof')
+      profile.dump_stats(stage['profile'])
+
+    stage['wall_seconds'] = time.perf_counter() - start_time
+    stage['cpu_seconds'] = time.process_time() - start_cpu_time
+    stage['peak_rss_mb'] = get_peak_rss_mb()
+
+    for counter_name, count in instrumentation['counters'].items():
+      stage[counter_name] = count - start_counters[counter_name]
+
+    instrumentation['stages'][stage_name] = stage
+
+def record_instrumentation_counter(counter_name, count=1):
+  if instrumentation is not None:
+    with instrumentation['lock']:
+      instrumentation['counters'][counter_name] += count
+
+def record_http_request(response, seconds):
+  if instrumentation is None:
+    return
+
+  retries = getattr(getattr(response, 'raw', None), 'retries', None)
+
+  record_instrumentation_counter('http_requests')
+  record_instrumentation_counter('http_seconds', seconds)
+  record_instrumentation_counter('cache_misses')
+  record_instrumentation_counter('retries', len(retries.history) if retries is not None else 0)
+
+def get_peak_rss_mb():
+  if resource is None:
+    return None
+
+  peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+  if sys.platform == 'darwin':
+    return peak_rss / 1024.0 / 1024.0
+  return peak_rss / 1024.0
+
+def write_instrumentation_report(report_filename, report):
+  with open(report_filename, 'w') as report_file:
+    json.dump(report, report_file, indent=2)
+
+def parse_date_range(value):
+  try:
+    from_date, to_date = [pd.Timestamp(date.strip()) for date in value.split(',')]
+  except ValueError:
+    from_date = to_date = pd.NaT
+
+  if pd.isnull(from_date) or pd.isnull(to_date):
+    raise argparse.ArgumentTypeError('expected two dates separated by a comma, e.g. 2017-01-01,2017-12-31')
+
+  return from_date, to_date
+
+def parse_arguments(arguments=None):
+  parser = argparse.ArgumentParser(description='Match CoinTracking.info buys and sells using FIFO and calculate realized and unrealized totals and average prices.')
+  parser.add_argument('-i', '--input', default=cointracking_input_filename, help='CoinTracking.info trade list CSV file (default: "%(default)s")')
+  parser.add_argument('-o', '--output', default=excel_output_filename, help='Excel output file; other output files are named after it (default: "%(default)s")')
+  parser.add_argument('-c', '--valuation-currencies', help='comma-separated valuation cryptocurrencies; prompts when omitted and run interactively, otherwise defaults to ' + ','.join(default_valuation_cryptocurrencies))
+  parser.add_argument('-f', '--output-formats', default=','.join(output_formats), help='comma-separated output formats out of ' + ', '.join(supported_output_formats) + ' (default: "%(default)s")')
+  parser.add_argument('--checkpoint', default=checkpoint_filename, help='checkpoint file for incremental runs (default: "%(default)s")')
+  parser.add_argument('-t', '--tables', default=','.join(output_tables), help='comma-separated tables to output out of ' + ', '.join(output_tables) + '; only the tables they depend on are created, and input is the copy of the input file in the Excel workbook (default: all; not used with --batch)')
+  parser.add_argument('--full-rebuild', action='store_true', help='ignore and do not write the checkpoint file and table cache')
+  parser.add_argument('--cache-dir', metavar='DIRECTORY', default=table_cache_directory, help='directory for the tables of the last run, which are reused when the input file and valuation currencies are unchanged (default: "%(default)s")')
+  parser.add_argument('--price-store', default=price_store_filename, help='historical price store file (default: "%(default)s")')
+  parser.add_argument('--warm-prices', metavar='FROM,TO', type=parse_date_range, help='first fill the price store with the hourly prices of the valuation cryptocurrencies in the fiat currency of each input file between two dates (e.g. 2017-01-01,2017-12-31)')
+  parser.add_argument('--batch', metavar='DIRECTORY', help='process every CSV trade list in DIRECTORY instead of the input file')
+  parser.add_argument('--batch-output', metavar='DIRECTORY', default=batch_output_directory, help='output directory for --batch; output files are named after each trade list (default: "%(default)s")')
+  parser.add_argument('--workers', type=int, help='number of worker processes for --batch (default: number of CPUs)')
+  parser.add_argument('--exact-rates', action='store_true', help='request every fiat and cryptocurrency pair of --batch from CryptoCompare instead of deriving cross rates, e.g. for audits')
+  parser.add_argument('--report', metavar='FILE', help='write a JSON report with the time, memory, HTTP requests and cache hits of each stage to FILE')
+  parser.add_argument('--profile-dir', metavar='DIRECTORY', help='write a cProfile dump of each stage to DIRECTORY')
+
+  return parser.parse_args(arguments)
+
+def main(arguments=None):
+  arguments = parse_arguments(arguments)
+
+  if arguments.report or arguments.profile_dir:
+    start_instrumentation(arguments.profile_dir)
+
+  try:
+    selected_output_formats = [output_format.strip().lower() for output_format in arguments.output_formats.split(',')]
+    check_output_formats(selected_output_formats)
+    selected_tables = [table_name.strip().lower() for table_name in arguments.tables.split(',')]
+    check_table_names(selected_tables, output_tables)
+
+    cryptocompare_session = create_cryptocompare_session()
+    coinmarketcap_session = create_coinmarketcap_session()
+    price_store = open_price_store(arguments.price_store)
+    evict_price_store(price_store, price_store_max_age, price_store_max_rows)
+
+    if arguments.valuation_currencies is None:
+      valuation_cryptocurrencies = get_valuation_cryptocurrencies(cryptocompare_session)
+    else:
+      valuation_cryptocurrencies = parse_valuation_cryptocurrencies(arguments.valuation_currencies)
+
+    if arguments.warm_prices:
+      with instrument_stage('warm_price_store') as stage:
+        input_filenames = sorted(glob.glob(os.path.join(arguments.batch, '*.csv'))) if arguments.batch else [arguments.input]
+        warm_price_store_for_input_files(price_store, input_filenames, valuation_cryptocurrencies, arguments.warm_prices[0], arguments.warm_prices[1], cryptocompare_session)
+        stage['rows'] = len(input_filenames)
+
+    if arguments.batch:
+      batch_results = run_batch(arguments.batch, arguments.batch_output, valuation_cryptocurrencies, selected_output_formats, cryptocompare_session, coinmarketcap_session, price_store, not arguments.full_rebuild and bool(arguments.checkpoint), arguments.workers, arguments.exact_rates)
+    else:
+      tables = create_portfolio_tables(arguments.input, valuation_cryptocurrencies, cryptocompare_session, coinmarketcap_session, price_store, None if arguments.full_rebuild else arguments.checkpoint, [table_name for table_name in selected_tables if table_name != 'input'], None if arguments.full_rebuild else arguments.cache_dir)
+
+      with instrument_stage('write_output_files') as stage:
+        output_filenames = write_output_files(arguments.input if 'input' in selected_tables else None, tables, selected_output_formats, arguments.output)
+        stage['rows'] = sum(len(df.index) for df in tables.values())
+  except PortfolioDataError as error:
+    print(str(error))
+    raise SystemExit(1)
+  finally:
+    if instrumentation is not None:
+      report = stop_instrumentation()
+      if arguments.report:
+        write_instrumentation_report(arguments.report, report)
+
+  if arguments.batch:
+    for input_filename, result in batch_results.items():
+      if isinstance(result, PortfolioDataError):
+        print('\n' + input_filename + ': ' + str(result))
+      else:
+        print('\n' + input_filename + ': Successfully generated ' + ', '.join(result))
+
+    if any(isinstance(result, PortfolioDataError) for result in batch_results.values()):
+      raise SystemExit(1)
+  else:
+    print('\n' + 'Successfully generated ' + ', '.join(output_filenames))
   
 fiat_currencies = ['AED', 'ARS', 'AUD', 'BRL', 'CAD', 'CHF', 'CLP', 'CNY', 'CZK', 'DKK', 'EUR', 'GBP', 'HKD', 'HUF', 'IDR', 'ILS', 'INR', 'JPY', 'KRW', 'MXN', 'MYR', 'NOK', 'NZD', 'PHP', 'PKR', 'PLN', 'RON', 'RUB', 'SEK', 'SGD', 'THB', 'TRY', 'TWD', 'UAH', 'USD', 'ZAR']
+fiat_currency_set = set(fiat_currencies)
   
 internal_decimal_places = 8
+internal_rounding_factor = 10.0 ** internal_decimal_places
+seconds_per_hour = 3600
 
-pandas.io.formats.excel.header_style = None
 pd.options.mode.chained_assignment = None
 
 cointracking_input_filename = 'CoinTracking · Trade List.csv'
+default_valuation_cryptocurrencies = ['BTC', 'ETH']
+input_chunk_size = 100000
+matching_workers = os.cpu_count() or 1
+parallel_matching_min_trades = 100000
+vectorized_match_min_trades = 16
+categorical_input_columns = ['type', 'buy_currency', 'sell_currency', 'exchange']
+trade_date_format = '%d.%m.%Y %H:%M'
 excel_output_filename = 'portfolio_data.xlsx'
+excel_max_rows = 1048576
+supported_output_formats = ['xlsx', 'csv', 'parquet', 'arrow']
+output_formats = ['xlsx']
+price_store_filename = 'price_store.sqlite'
+price_store_max_age = None
+price_store_max_rows = None
+checkpoint_filename = 'portfolio_data_checkpoint.pkl'
+instrumentation = None
+instrumentation_counter_names = ['http_requests', 'http_seconds', 'cache_hits', 'cache_misses', 'retries', 'price_store_hits', 'price_store_misses', 'table_cache_hits', 'table_cache_misses']
+batch_output_directory = 'portfolio_data'
+checkpoint_version = 2
+table_cache_directory = 'portfolio_data_cache'
+table_cache_version = 1
+margins_name = 'Total'
+table_graph = OrderedDict([
+  ('buy_and_sell_match', (create_buy_and_sell_match_table, [])),
+  ('realized_totals', (create_realized_totals_table, ['buy_and_sell_match'])),
+  ('realized_average_prices', (create_average_prices_table, ['realized_totals'])),
+  ('unrealized_totals', (create_unrealized_totals_table, ['buy_and_sell_match'])),
+  ('unrealized_average_prices', (create_average_prices_table, ['unrealized_totals']))
+  ])
+realized_table_names = ['buy_and_sell_match', 'realized_totals', 'realized_average_prices']
+live_tables = ['unrealized_totals', 'unrealized_average_prices']
+output_tables = ['input'] + list(table_graph)
 
 error_codes = set([400, 401, 403, 404, 500, 502, 503, 504])
 cryptocompare_api_base_url = 'https://min-api.cryptocompare.com/data/'
+cryptocompare_histohour_limit = 2000
 coinmarketcap_api_base_url = 'https://api.coinmarketcap.com/v2/'
+coinmarketcap_ticker_limit = 100
+coinmarketcap_id_filename = 'coinmarketcap_ids.json'
+coinmarketcap_id_max_age = 86400
+coinmarketcap_id_overrides = {'CPC': 2482}
+current_price_max_age = 120
+current_price_quotes = {}
+
+concurrent_request_limit = 8
+rate_limits = {
+  'cryptocompare': create_rate_limit(requests_per_second=15, burst=15),
+  'coinmarketcap': create_rate_limit(requests_per_second=1, burst=10)
+  }
 
 if __name__ == '__main__':
   main()
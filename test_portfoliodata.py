@@ -0,0 +1,137 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pytest
+
+import portfoliodata
+
+def create_buy_df(rows):
+  return pd.DataFrame(rows, columns=['buy', 'buy_currency', 'buy_value_usd', 'exchange', 'comment', 'trade_date']).astype({'trade_date': 'datetime64[ns]'})
+
+def create_sell_df(rows):
+  return pd.DataFrame(rows, columns=['sell', 'sell_currency', 'sell_value_usd', 'exchange', 'comment', 'trade_date']).astype({'trade_date': 'datetime64[ns]'})
+
+def create_random_trades(trade_count, currency_count, seed):
+  random_state = np.random.RandomState(seed)
+  currencies = ['COIN' + str(i) for i in range(currency_count)]
+  buy_currencies = random_state.randint(currency_count, size=trade_count)
+  buy_quantities = random_state.uniform(1, 10, trade_count).round(8)
+  buy_values = random_state.uniform(1, 1000, trade_count).round(8)
+  buy_dates = pd.Timestamp('2017-01-01') + pd.to_timedelta(np.sort(random_state.randint(0, 10000, trade_count)), unit='m')
+  buy_df = create_buy_df([[buy_quantities[i], currencies[buy_currencies[i]], buy_values[i], 'Exchange', '', buy_dates[i]] for i in range(trade_count)])
+
+  sell_rows = []
+  for currency, currency_buy_df in buy_df.groupby('buy_currency'):
+    balance = currency_buy_df['buy'].sum()
+    for i in range(random_state.randint(1, 20)):
+      sell_quantity = round(balance * random_state.uniform(0.05, 0.3), 8)
+      balance -= sell_quantity
+      sell_rows.append([sell_quantity, currency, round(random_state.uniform(1, 1000), 8), 'Exchange', 'Gift' if random_state.uniform() < 0.1 else '', pd.Timestamp('2017-02-01') + pd.Timedelta(minutes=random_state.randint(0, 10000))])
+
+  return buy_df, create_sell_df(sell_rows)
+
+def test_match_buys_and_sells_uses_fifo_and_excludes_gifts():
+  buy_df = create_buy_df([
+    [1.0, 'BTC', 100.0, 'Exchange1', '', '2017-01-01 00:00'],
+    [2.0, 'BTC', 400.0, 'Exchange2', '', '2017-01-02 00:00'],
+    [5.0, 'ETH', 50.0, 'Exchange1', '', '2017-01-03 00:00']
+    ])
+  sell_df = create_sell_df([
+    [1.5, 'BTC', 300.0, 'Exchange1', '', '2017-01-04 00:00'],
+    [0.5, 'BTC', 50.0, 'Exchange1', ' GIFT', '2017-01-05 00:00'],
+    [0.5, 'BTC', 200.0, 'Exchange2', '', '2017-01-06 00:00']
+    ])
+
+  buy_and_sell_match_df, remaining_buy_df = portfoliodata.match_buys_and_sells(buy_df, sell_df, ['USD'])
+
+  assert buy_and_sell_match_df['quantity'].tolist() == [1.0, 0.5, 0.5]
+  assert buy_and_sell_match_df['buy_date'].tolist() == [pd.Timestamp('2017-01-01'), pd.Timestamp('2017-01-02'), pd.Timestamp('2017-01-02')]
+  assert buy_and_sell_match_df['sell_date'].tolist() == [pd.Timestamp('2017-01-04'), pd.Timestamp('2017-01-04'), pd.Timestamp('2017-01-06')]
+  assert buy_and_sell_match_df['buy_value_usd'].tolist() == [100.0, 100.0, 100.0]
+  assert buy_and_sell_match_df['sell_value_usd'].tolist() == [200.0, 100.0, 200.0]
+  assert buy_and_sell_match_df['gain_loss_usd'].tolist() == [100.0, 0.0, 100.0]
+  assert buy_and_sell_match_df['buy_exchange'].tolist() == ['Exchange1', 'Exchange2', 'Exchange2']
+
+  assert remaining_buy_df['buy_currency'].tolist() == ['BTC', 'ETH']
+  assert remaining_buy_df['buy'].tolist() == [0.5, 5.0]
+  assert remaining_buy_df['buy_value_usd'].tolist() == [100.0, 50.0]
+
+def test_match_buys_and_sells_rejects_sell_before_buy():
+  buy_df = create_buy_df([[1.0, 'BTC', 100.0, 'Exchange', '', '2017-01-02 12:00']])
+  sell_df = create_sell_df([[0.5, 'BTC', 80.0, 'Exchange', '', '2017-01-01 12:00']])
+
+  with pytest.raises(portfoliodata.TradeDataError) as error:
+    portfoliodata.create_buy_and_sell_match_df(buy_df, sell_df, ['USD'])
+
+  assert str(error.value) == 'Sell for BTC on 2017-01-01 12:00:00 cannot be matched with a buy.  The closest buy occurred at a later date: 2017-01-02 12:00:00.  Please correct input file and try again.'
+
+def test_oversold_currency_is_rejected():
+  buy_df = create_buy_df([[1.0, 'BTC', 100.0, 'Exchange', '', '2017-01-01 00:00']])
+  sell_df = create_sell_df([[1.5, 'BTC', 300.0, 'Exchange', '', '2017-01-02 00:00']])
+  error_message = 'The units sold of BTC exceed the units acquired.  Please correct the input file and try again.'
+
+  with pytest.raises(portfoliodata.TradeDataError) as error:
+    portfoliodata.check_for_valid_buy_and_sell_quantities(buy_df, sell_df)
+  assert str(error.value) == error_message
+
+  with pytest.raises(portfoliodata.TradeDataError) as error:
+    portfoliodata.match_buys_and_sells(buy_df, sell_df, ['USD'])
+  assert str(error.value) == error_message
+
+def test_parallel_matching_equals_serial_matching(monkeypatch):
+  buy_df, sell_df = create_random_trades(2000, 12, 0)
+  buy_df.index = buy_df.index * 2 + 7
+
+  serial_match_df, serial_remaining_buy_df = portfoliodata.match_buys_and_sells(buy_df, sell_df, ['USD'])
+
+  monkeypatch.setattr(portfoliodata, 'parallel_matching_min_trades', 0)
+  parallel_match_df, parallel_remaining_buy_df = portfoliodata.match_buys_and_sells_by_currency(buy_df, sell_df, ['USD'], 3)
+
+  pd.testing.assert_frame_equal(portfoliodata.combine_matches_and_remaining_buys(parallel_match_df, parallel_remaining_buy_df), portfoliodata.combine_matches_and_remaining_buys(serial_match_df, serial_remaining_buy_df))
+  pd.testing.assert_frame_equal(parallel_remaining_buy_df, serial_remaining_buy_df)
+
+def test_traded_valuation_currencies_are_valued_by_their_own_quantity():
+  input_df = portfoliodata.format_input_df(pd.DataFrame([
+    ['Trade', '0.5', 'BTC', '990', '1000', 'USD', '990', 'Exchange', '', '01.02.2017 10:30'],
+    ['Trade', '10', 'ETH', '900', '0.4', 'BTC', '890', 'Exchange', '', '01.02.2017 11:30'],
+    ['Income', '2', 'LTC', '40', '-', '', '0', 'Exchange', '', '01.02.2017 11:45']
+    ], columns=['Type', 'Buy', 'Cur.', 'Buy value in USD', 'Sell', 'Cur.', 'Sell value in USD', 'Exchange', 'Comment', 'Trade Date']))
+  input_df['buy_is_currency_fiat'] = portfoliodata.get_are_currencies_fiat(input_df['buy_currency'])
+  input_df['sell_is_currency_fiat'] = portfoliodata.get_are_currencies_fiat(input_df['sell_currency'])
+
+  hours = [int(pd.Timestamp('2017-02-01 ' + hour).timestamp()) for hour in ['09:00', '10:00', '11:00']]
+  price_store = portfoliodata.open_price_store(':memory:')
+  portfoliodata.load_price_store(price_store, OrderedDict([
+    (('USD', 'BTC'), pd.Series([0.001, 0.002, 0.003], index=hours)),
+    (('USD', 'ETH'), pd.Series([0.01, 0.02, 0.03], index=hours))
+    ]))
+
+  input_df = portfoliodata.add_trade_valuations_to_input_df(input_df, ['USD', 'BTC', 'ETH'], None, price_store)
+
+  assert input_df['buy_value_usd'].tolist() == [1000.0, 890.0, 40.0]
+  assert input_df['buy_value_btc'].tolist() == pytest.approx([0.5, 0.4, 0.1])
+  assert input_df['buy_value_eth'].tolist() == pytest.approx([15.0, 10.0, 1.0])
+  assert input_df['sell_value_btc'].tolist() == input_df['buy_value_btc'].tolist()
+  assert input_df['sell_value_eth'].tolist() == input_df['buy_value_eth'].tolist()
+
+def test_rate_limits_throttle_each_provider_separately(monkeypatch):
+  sleeps = []
+  monkeypatch.setattr(portfoliodata.time, 'sleep', sleeps.append)
+  monkeypatch.setattr(portfoliodata, 'cryptocompare_api_base_url', 'http://127.0.0.1:8000/data/')
+  monkeypatch.setattr(portfoliodata, 'coinmarketcap_api_base_url', 'http://127.0.0.1:8000/v2/')
+  monkeypatch.setattr(portfoliodata, 'rate_limits', {
+    'cryptocompare': portfoliodata.create_rate_limit(requests_per_second=1, burst=2),
+    'coinmarketcap': portfoliodata.create_rate_limit(requests_per_second=1, burst=2)
+    })
+
+  for i in range(4):
+    portfoliodata.wait_for_rate_limit('http://127.0.0.1:8000/data/histohour')
+  assert sleeps == [pytest.approx(1, abs=0.1), pytest.approx(2, abs=0.1)]
+
+  for i in range(2):
+    portfoliodata.wait_for_rate_limit('http://127.0.0.1:8000/v2/ticker/')
+  portfoliodata.wait_for_rate_limit('http://127.0.0.1:8000/other/')
+  assert len(sleeps) == 2
+
+  portfoliodata.wait_for_rate_limit('http://127.0.0.1:8000/v2/ticker/')
+  assert sleeps[2:] == [pytest.approx(1, abs=0.1)]